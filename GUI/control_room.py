@@ -7,7 +7,9 @@ from urllib.parse import urlparse, parse_qs
 from GUI.profiles import STab
 from core import utils, tp_text
 from core.img_rehost import IH
-from core.transplant import Job, Transplanter, JobCreationError
+from core.transplant import Job, Transplanter, JobCreationError, JobTimeout
+from core.dtor_scan import parse_dtors
+from core.lean_torrent import HashingInterrupted
 from gazelle.tracker_data import TR
 from GUI import gui_text
 from GUI.main_gui import MainWindow
@@ -45,7 +47,7 @@ class TransplantThread(QThread):
             TR.RED: wb.config.value('main/le_key_1'),
             TR.OPS: wb.config.value('main/le_key_2')
         }
-        transplanter = Transplanter(key_dict, **self.trpl_settings)
+        transplanter = Transplanter(key_dict, stop_check=self.isInterruptionRequested, **self.trpl_settings)
 
         for job in wb.job_data.jobs.copy():
             if self.isInterruptionRequested():
@@ -56,6 +58,12 @@ class TransplantThread(QThread):
                     continue
                 try:
                     success = transplanter.do_your_job(job)
+                except JobTimeout as e:
+                    logger.error(str(e))
+                    continue
+                except HashingInterrupted as e:
+                    logger.info(str(e))
+                    continue
                 except Exception:
                     logger.exception('')
                     continue
@@ -66,6 +74,26 @@ class TransplantThread(QThread):
                 logger.info('')
 
 
+class ScanThread(QThread):
+    # Parses .torrents off the GUI thread. Results come in batches, so the job list fills while scanning.
+    found = pyqtSignal(list)
+    BATCH = 100
+
+    def __init__(self, paths: list[Path]):
+        super().__init__()
+        self.paths = paths
+
+    def run(self):
+        batch = []
+        for p, meta in parse_dtors(self.paths):
+            batch.append((p, meta))
+            if len(batch) >= self.BATCH:
+                self.found.emit(batch)
+                batch = []
+        if batch:
+            self.found.emit(batch)
+
+
 def start_up():
     wb.main_window = MainWindow()
     set_shortcuts()
@@ -134,6 +162,7 @@ def config_connections():
     wb.fsb_dtor_save_dir.list_changed.connect(
         lambda: wb.pb_open_tsavedir.setEnabled(bool(wb.fsb_dtor_save_dir.currentText())))
     wb.chb_deep_search.toggled.connect(wb.spb_deep_search_level.setEnabled)
+    wb.chb_piece_check.toggled.connect(wb.spb_piece_sample.setEnabled)
     wb.chb_show_tips.toggled.connect(wb.tt_filter.set_tt_enabled)
     wb.spb_verbosity.valueChanged.connect(set_verbosity)
     wb.chb_rehost.toggled.connect(wb.rh_on_off_container.setEnabled)
@@ -224,10 +253,33 @@ LEVEL_SETTING_NAME_MAP = {
 }
 
 
+progress_start = None
+
+
+def print_progress(msg: str):
+    # progress messages replace each other on one line at the end of the results
+    global progress_start
+    cursor = QTextCursor(wb.result_view.document())
+    cursor.movePosition(QTextCursor.MoveOperation.End)
+    if progress_start is None or progress_start > cursor.position():
+        cursor.insertHtml('<br>')
+        progress_start = cursor.position()
+    else:
+        cursor.setPosition(progress_start, QTextCursor.MoveMode.KeepAnchor)
+    cursor.insertText(msg)
+    wb.result_view.ensureCursorVisible()
+
+
 def print_logs(record: logging.LogRecord):
+    global progress_start
     if wb.tabs.count() == 1:
         wb.tabs.addTab(gui_text.tab_results)
 
+    if getattr(record, 'progress', False):
+        print_progress(record.msg)
+        return
+    progress_start = None
+
     cls_val_q, same_line = divmod(record.levelno, 5)
     cls_name = LEVEL_SETTING_NAME_MAP.get(cls_val_q * 5)
     prefix = '&nbsp;' if same_line else '<br>'
@@ -262,10 +314,16 @@ def trpl_settings():
     user_settings = (
         'main/chb_deep_search',
         'main/spb_deep_search_level',
+        'main/chb_content_search',
         'main/chb_save_dtors',
         'main/chb_del_dtors',
         'main/chb_file_check',
+        'main/chb_piece_check',
+        'main/spb_piece_sample',
+        'main/chb_spare_page_cache',
         'main/chb_post_compare',
+        'main/spb_job_timeout',
+        'main/spb_info_cache_ttl',
         'descriptions/te_rel_descr_templ',
         'descriptions/te_rel_descr_own_templ',
         'descriptions/chb_add_src_descr',
@@ -383,26 +441,42 @@ def select_dtors():
 
     wb.config.setValue('torselect_dir', common_path)
 
-    new_jobs = JobCollector()
-    for fp in file_paths:
-        p = Path(fp)
-        new_jobs.collect(p.name, dtor_path=p)
-
-    new_jobs.add_jobs_2_joblist()
+    start_scan([Path(p) for p in file_paths], {})
 
 
 def scan_dtorrents():
     scan_path = Path(wb.fsb_scan_dir.currentText())
     wb.tabs.setCurrentIndex(0)
 
-    torpaths = tuple(scan_path.glob('*.torrent'))
-    new_jobs = JobCollector()
+    torpaths = list(scan_path.glob('*.torrent'))
+    poptxt = gui_text.pop2 if torpaths else gui_text.pop1
+    start_scan(torpaths, {'scanned': True}, f'{poptxt}\n{scan_path}')
 
-    for p in torpaths:
-        new_jobs.collect(p.name, dtor_path=p, scanned=True)
 
-    poptxt = gui_text.pop2 if torpaths else gui_text.pop1
-    new_jobs.add_jobs_2_joblist(f'{poptxt}\n{scan_path}')
+def start_scan(paths: list[Path], job_kwargs: dict, empty_msg: str = None):
+    if wb.scan_thread and wb.scan_thread.isRunning():
+        return
+
+    added = 0
+
+    def add_batch(batch: list):
+        nonlocal added
+        new_jobs = JobCollector()
+        for p, meta in batch:
+            new_jobs.collect(p.name, dtor_path=p, dtor_meta=meta, **job_kwargs)
+        if new_jobs.jobs:
+            wb.job_data.append_jobs(new_jobs.jobs)
+            added += len(new_jobs.jobs)
+
+    def done():
+        if not added and empty_msg:
+            wb.pop_up.pop_up(empty_msg)
+        wb.job_view.setFocus()
+
+    wb.scan_thread = ScanThread(paths)
+    wb.scan_thread.found.connect(add_batch)
+    wb.scan_thread.finished.connect(done)
+    wb.scan_thread.start()
 
 
 def settings_check():
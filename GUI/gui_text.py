@@ -79,6 +79,13 @@ keycheck_bad_key = ('Not a valid key\n'
 keycheck_good_key = 'Hello {}, this key is valid'
 
 chb_deep_search = 'Deep search to level:'
+chb_content_search = 'Find renamed folders by file sizes'
+spb_piece_sample_all = 'all pieces'
+spb_piece_sample_suffix = ' pieces per file'
+spb_job_timeout_off = 'no limit'
+spb_job_timeout_suffix = ' min'
+spb_info_cache_ttl_off = 'off'
+spb_info_cache_ttl_suffix = ' h'
 
 default_whitelist = "ptpimg.me, thesungod.xyz"
 rehost_columns = ('Host', 'API key')
@@ -117,7 +124,11 @@ l_scan_dir = 'Scan folder'
 l_save_dtors = 'Save new .torrrents'
 l_del_dtors = 'Delete scanned .torrents'
 l_file_check = 'Check files'
+l_piece_check = 'Check pieces'
+l_spare_page_cache = 'Spare file cache'
 l_post_compare = 'Post upload checks'
+l_job_timeout = 'Job time limit'
+l_info_cache_ttl = 'Keep torrent info'
 l_show_tips = "Show tooltips"
 l_verbosity = 'Verbosity'
 l_rehost = 'Rehost cover art'
@@ -150,6 +161,10 @@ tooltips = {
     'l_data_dir': "This should be the top level folder where the album folders can be found",
     'chb_deep_search': ("When checked, the data folder will be searched for torrent folders up til 'level' deep,\n"
                         "level 1 is direct subfolder of data dir. Subfolder of that is level 2 etc."),
+    'chb_content_search': ("When the torrent folder can't be found by name,\n"
+                           "look for a folder with files of the same sizes\n"
+                           "Candidates are confirmed with a quick piece check against the source .torrent\n"
+                           "Searches as deep as deep search, or level 1 when deep search is off"),
     'l_scan_dir': ("This folder will be scanned for .torrents when the 'Scan' button is pressed\n"
                    "You can download the .torrents from the source tracker here"),
     'l_save_dtors': ("Newly created .torrents from the destination tracker can be saved here\n"
@@ -162,7 +177,18 @@ tooltips = {
                     "These will not be deleted"),
     'l_file_check': ("if checked, Transplant will verify that the torrent content (~music files) can be found\n"
                      "This will prevent transplanting torrents that you can't seed"),
+    'l_piece_check': ("if checked, the file content is checked against the piece hashes of the source .torrent\n"
+                      "Only the selected number of random pieces per file are checked. This is a lot faster\n"
+                      "Requires 'Check files'"),
+    'l_spare_page_cache': ("Keep the reads for new torrents and piece checks out of the system's file cache\n"
+                           "so a torrent client on the same machine keeps its cached data\n"
+                           "Linux/BSD only"),
     'l_post_compare': "Check if the upload was merged into an existing group or if the log scores are different",
+    'l_job_timeout': ("Give up on a job that takes longer than this and move on to the next\n"
+                      "Checked between steps, an upload that has started is always finished"),
+    'l_info_cache_ttl': ("Torrent info from the trackers is reused for this long,\n"
+                         "so jobs that are run again only spend requests on uploading\n"
+                         "Post upload checks always ask the tracker"),
     'l_show_tips': "Tip the tools",
     'l_verbosity': ("Level of feedback.\n"
                     "0: silent\n"
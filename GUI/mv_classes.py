@@ -139,8 +139,8 @@ class JobModel(QAbstractTableModel):
 
         if role == Qt.ItemDataRole.DisplayRole:
             if column == 0:
-                if job.dtor_dict and torrent_folder:
-                    show_name = job.dtor_dict['info']['name']
+                if job.dtor_name and torrent_folder:
+                    show_name = job.dtor_name
                 else:
                     show_name = job.display_name or job.tor_id
                 if no_icon:
@@ -25,8 +25,14 @@ class SettingsWindow(QDialog):
         deep_search.addWidget(wb.spb_deep_search_level)
         deep_search.addStretch()
         data_dir.addLayout(deep_search)
+        data_dir.addWidget(wb.chb_content_search)
         data_dir.setSpacing(5)
 
+        piece_check = QHBoxLayout()
+        piece_check.addWidget(wb.chb_piece_check)
+        piece_check.addWidget(wb.spb_piece_sample)
+        piece_check.addStretch()
+
         save_dtor = QHBoxLayout()
         save_dtor.addWidget(wb.chb_save_dtors)
         save_dtor.addWidget(wb.fsb_dtor_save_dir)
@@ -51,7 +57,11 @@ class SettingsWindow(QDialog):
         settings_form.addRow(wb.l_save_dtors, save_dtor)
         settings_form.addRow(wb.l_del_dtors, wb.chb_del_dtors)
         settings_form.addRow(wb.l_file_check, wb.chb_file_check)
+        settings_form.addRow(wb.l_piece_check, piece_check)
+        settings_form.addRow(wb.l_spare_page_cache, wb.chb_spare_page_cache)
         settings_form.addRow(wb.l_post_compare, wb.chb_post_compare)
+        settings_form.addRow(wb.l_job_timeout, wb.spb_job_timeout)
+        settings_form.addRow(wb.l_info_cache_ttl, wb.spb_info_cache_ttl)
         settings_form.addRow(wb.l_show_tips, wb.chb_show_tips)
         settings_form.addRow(wb.l_verbosity, wb.spb_verbosity)
 
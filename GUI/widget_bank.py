@@ -46,12 +46,18 @@ CONFIG_NAMES = {
         'fsb_data_dir': ([], True),
         'chb_deep_search': (False, False),
         'spb_deep_search_level': (2, False),
+        'chb_content_search': (False, False),
         'fsb_scan_dir': ([], True),
         'fsb_dtor_save_dir': ([], False),
         'chb_save_dtors': (False, True),
         'chb_del_dtors': (False, True),
         'chb_file_check': (True, True),
+        'chb_piece_check': (False, True),
+        'spb_piece_sample': (4, False),
+        'chb_spare_page_cache': (False, True),
         'chb_post_compare': (False, True),
+        'spb_job_timeout': (0, True),
+        'spb_info_cache_ttl': (24, True),
         'chb_show_tips': (True, True),
         'spb_verbosity': (2, True),
     },
@@ -103,6 +109,7 @@ class WidgetBank:
 
         self._pop_up = None
         self.thread = None
+        self.scan_thread = None
 
     @property
     def pop_up(self):
@@ -344,6 +351,15 @@ class WidgetBank:
 
         self.chb_deep_search.setText(gui_text.chb_deep_search)
         self.spb_deep_search_level.setMinimum(2)
+        self.chb_content_search.setText(gui_text.chb_content_search)
+        self.spb_piece_sample.setSpecialValueText(gui_text.spb_piece_sample_all)
+        self.spb_piece_sample.setSuffix(gui_text.spb_piece_sample_suffix)
+        self.spb_job_timeout.setMaximum(999)
+        self.spb_job_timeout.setSpecialValueText(gui_text.spb_job_timeout_off)
+        self.spb_job_timeout.setSuffix(gui_text.spb_job_timeout_suffix)
+        self.spb_info_cache_ttl.setMaximum(999)
+        self.spb_info_cache_ttl.setSpecialValueText(gui_text.spb_info_cache_ttl_off)
+        self.spb_info_cache_ttl.setSuffix(gui_text.spb_info_cache_ttl_suffix)
         self.spb_verbosity.setMaximum(3)
         self.spb_verbosity.setMaximumWidth(40)
 
@@ -0,0 +1,76 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+from hashlib import sha1
+from pathlib import Path
+
+from bcoding import bencode, bdecode
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from core import dtor_scan
+
+
+def legacy_parse(path: Path):
+    # what Job did per .torrent before: decode everything and encode info again for the hash
+    dtor_dict = bdecode(path.read_bytes())
+    return sha1(bencode(dtor_dict['info'])).hexdigest(), dtor_dict['info'].get('source')
+
+
+def make_dtors(folder: Path, count: int, n_files: int, n_pieces: int):
+    for i in range(count):
+        info = {
+            'files': [{'length': 30_000_000 + f, 'path': ['CD1', f'{f:02d} track {i}.flac']} for f in range(n_files)],
+            'name': f'Artist - Album {i} [FLAC]',
+            'piece length': 2 ** 18,
+            'pieces': os.urandom(20 * n_pieces),
+            'private': 1,
+            'source': 'RED',
+        }
+        (folder / f'{i}.torrent').write_bytes(bencode({'announce': 'https://flacsfor.me/x/announce', 'info': info}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare serial .torrent parsing with the process pool loader')
+    parser.add_argument('--count', type=int, default=2000)
+    parser.add_argument('--files', type=int, default=20)
+    parser.add_argument('--pieces', type=int, default=2500)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        make_dtors(folder, args.count, args.files, args.pieces)
+        paths = sorted(folder.glob('*.torrent'))
+
+        start = time.perf_counter()
+        legacy = [legacy_parse(p) for p in paths]
+        t_legacy = time.perf_counter() - start
+
+        start = time.perf_counter()
+        serial = [dtor_scan.parse_dtor(p) for p in paths]
+        t_serial = time.perf_counter() - start
+
+        db_path = folder / 'scan_cache.sqlite'
+        start = time.perf_counter()
+        pooled = [meta for _, meta in dtor_scan.parse_dtors(paths, workers=args.workers, db_path=db_path)]
+        t_pool = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rescan = [meta for _, meta in dtor_scan.parse_dtors(paths, workers=args.workers, db_path=db_path)]
+        t_rescan = time.perf_counter() - start
+
+        hashes = [h for h, _ in legacy]
+        assert hashes == [m.info_hash for m in serial] == [m.info_hash for m in pooled] == [m.info_hash for m in rescan]
+
+        print(f'{args.count} .torrents, {args.pieces} pieces each')
+        print(f'decode + encode  {t_legacy:7.2f} s')
+        print(f'raw, serial      {t_serial:7.2f} s  {t_legacy / t_serial:5.1f}x')
+        print(f'raw, pool        {t_pool:7.2f} s  {t_legacy / t_pool:5.1f}x')
+        print(f'rescan, cached   {t_rescan:7.2f} s  {t_legacy / t_rescan:5.1f}x')
+
+
+if __name__ == '__main__':
+    main()
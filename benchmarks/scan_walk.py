@@ -0,0 +1,69 @@
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from core.utils import scanfiles
+
+
+def pathlib_walk(path: Path):
+    # the walker Torrent.scan_files used before: is_dir() and stat() on every Path
+    for p in path.iterdir():
+        if p.is_dir() and not p.name.startswith('.'):
+            yield from pathlib_walk(p)
+        else:
+            st = p.stat()
+            yield p, st.st_size, st.st_mtime_ns
+
+
+def scandir_walk(path: Path):
+    yield from scanfiles(path)
+
+
+def make_tree(root: Path, n_dirs: int, n_files: int, depth: int):
+    for d in range(n_dirs):
+        folder = root.joinpath(*(f'd{d}_{lvl}' for lvl in range(depth)))
+        folder.mkdir(parents=True, exist_ok=True)
+        for f in range(n_files):
+            (folder / f'{f:03d} scan.jpg').write_bytes(b'x' * (f % 7))
+
+
+def bench(walker, path: Path, repeat: int) -> tuple[float, int]:
+    best = float('inf')
+    count = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = sum(1 for _ in walker(path))
+        best = min(best, time.perf_counter() - start)
+    return best, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the pathlib and scandir directory walkers')
+    parser.add_argument('path', nargs='?', type=Path, help='existing tree to walk, e.g. on a network share')
+    parser.add_argument('--dirs', type=int, default=200)
+    parser.add_argument('--files', type=int, default=50)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.path
+        if not path:
+            path = Path(tmp)
+            make_tree(path, args.dirs, args.files, args.depth)
+
+        results = {}
+        for name, walker in (('pathlib', pathlib_walk), ('scandir', scandir_walk)):
+            results[name] = bench(walker, path, args.repeat)
+            secs, count = results[name]
+            print(f'{name:8} {count} files  {secs * 1000:8.1f} ms')
+
+        print(f'speedup  {results["pathlib"][0] / results["scandir"][0]:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+import os
+import time
+import sqlite3
+import multiprocessing
+from hashlib import sha1
+from pathlib import Path
+from typing import Iterable, Iterator
+from urllib.parse import urlparse
+from concurrent.futures import ProcessPoolExecutor
+
+from bcoding import bdecode
+
+from gazelle.tracker_data import TR
+from core import tp_text, raw_bencode
+from core.utils import store_path
+
+# a process pool only pays off from this many .torrents
+MIN_PARALLEL = 64
+CHUNK_SIZE = 32
+MAX_AGE = 90 * 24 * 3600
+
+
+class DtorMeta:
+    # What a Job needs from a .torrent. Small and picklable, so it can come back from a worker process.
+    def __init__(self, info_hash: str = None, src_tr: TR = None, name: str = None, error: str = None):
+        self.info_hash = info_hash
+        self.src_tr = src_tr
+        self.name = name
+        self.error = error
+
+
+def parse_dtor(path: Path) -> DtorMeta:
+    try:
+        return dtor_meta(path.read_bytes())
+    except OSError as e:
+        return DtorMeta(error=str(e))
+    except (KeyError, ValueError, IndexError, TypeError):
+        return DtorMeta(error=tp_text.not_dtor)
+
+
+def dtor_meta(torbytes: bytes) -> DtorMeta:
+    start, end = raw_bencode.info_span(torbytes)
+    meta = DtorMeta(info_hash=sha1(memoryview(torbytes)[start:end]).hexdigest())
+    if name_span := raw_bencode.dict_value(torbytes, b'name', start):
+        meta.name = bdecode(torbytes[slice(*name_span)])
+
+    if source_span := raw_bencode.dict_value(torbytes, b'source', start):
+        source = bdecode(torbytes[slice(*source_span)]).replace('PTH', 'RED')
+        try:
+            meta.src_tr = TR[source]
+            return meta
+        except KeyError:
+            pass
+
+    announce_span = raw_bencode.dict_value(torbytes, b'announce')
+    if not announce_span:
+        return meta
+    parsed = urlparse(bdecode(torbytes[slice(*announce_span)]))
+    if parsed.hostname:
+        for t in TR:
+            if parsed.hostname in t.tracker.lower():
+                meta.src_tr = t
+                break
+    return meta
+
+
+class ScanCache:
+    # Parsed .torrents by path, valid as long as size and mtime don't change
+    def __init__(self, db_path: Path = None):
+        self.con = sqlite3.connect(db_path or store_path('dtor_scan.sqlite'))
+        with self.con:
+            self.con.execute('CREATE TABLE IF NOT EXISTS dtors ('
+                             'path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, used REAL, '
+                             'info_hash TEXT, src_tr TEXT, name TEXT)')
+            self.con.execute('DELETE FROM dtors WHERE used < ?', (time.time() - MAX_AGE,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.con.close()
+
+    def get(self, path: Path, size: int, mtime: int) -> DtorMeta | None:
+        row = self.con.execute('SELECT size, mtime, info_hash, src_tr, name FROM dtors WHERE path = ?',
+                               (os.path.abspath(path),)).fetchone()
+        if not row or row[:2] != (size, mtime):
+            return None
+        info_hash, src_tr, name = row[2:]
+        return DtorMeta(info_hash, src_tr and TR[src_tr], name)
+
+    def put(self, path: Path, size: int, mtime: int, meta: DtorMeta):
+        # the caller commits
+        self.con.execute('INSERT OR REPLACE INTO dtors VALUES (?, ?, ?, ?, ?, ?, ?)',
+                         (os.path.abspath(path), size, mtime, time.time(), meta.info_hash,
+                          meta.src_tr and meta.src_tr.name, meta.name))
+
+    def touch(self, paths: list[Path]):
+        self.con.executemany('UPDATE dtors SET used = ? WHERE path = ?',
+                             ((time.time(), os.path.abspath(p)) for p in paths))
+
+
+def parse_dtors(paths: Iterable[Path], workers: int = None, db_path: Path = None) -> Iterator[tuple[Path, DtorMeta]]:
+    # Results come in the order of paths, as soon as they are ready.
+    # Only new or changed .torrents are parsed, the rest comes from the scan cache.
+    paths = list(paths)
+    with ScanCache(db_path) as cache:
+        known = {}
+        stats = {}
+        for p in paths:
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            stats[p] = st.st_size, st.st_mtime_ns
+            if meta := cache.get(p, *stats[p]):
+                known[p] = meta
+
+        todo = [p for p in paths if p not in known]
+        parsed = iter(parse_uncached(todo, workers))
+        try:
+            for p in paths:
+                if p in known:
+                    yield p, known[p]
+                    continue
+                _, meta = next(parsed)
+                if not meta.error and p in stats:
+                    # committed right away, the caller may take its time with every result
+                    with cache.con:
+                        cache.put(p, *stats[p], meta)
+                yield p, meta
+        finally:
+            with cache.con:
+                cache.touch(list(known))
+
+
+def parse_uncached(paths: list[Path], workers: int = None) -> Iterator[tuple[Path, DtorMeta]]:
+    if len(paths) < MIN_PARALLEL:
+        yield from zip(paths, map(parse_dtor, paths))
+        return
+
+    # Spawned, not forked. Forking a process that runs threads, like the GUI, can copy held locks into the workers
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        yield from zip(paths, pool.map(parse_dtor, paths, chunksize=CHUNK_SIZE))
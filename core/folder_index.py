@@ -0,0 +1,171 @@
+import os
+import sqlite3
+import logging
+from pathlib import Path
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from array import array
+from hashlib import sha1
+from typing import Iterator, Iterable
+
+from core import tp_text
+from core.utils import store_path, scanfiles
+
+report = logging.getLogger('tr.index')
+
+# concurrent directory listings, mostly waiting on network round trips
+WALK_THREADS = 8
+
+
+class FolderIndex:
+    # Folders below the library roots by name.
+    # A folder with an unchanged mtime still has the same subfolders, so refreshing only lists folders that changed.
+    # mtime is NULL for folders that were never listed.
+    def __init__(self, db_path: Path = None):
+        self.con = sqlite3.connect(db_path or store_path('folder_index.sqlite'))
+        with self.con:
+            self.con.execute('CREATE TABLE IF NOT EXISTS dirs ('
+                             'root TEXT, path TEXT, parent TEXT, name TEXT, level INTEGER, mtime INTEGER, '
+                             'PRIMARY KEY (root, path))')
+            self.con.execute('CREATE INDEX IF NOT EXISTS dirs_name ON dirs (name, root)')
+            self.con.execute('CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (root, parent)')
+            self.con.execute('CREATE TABLE IF NOT EXISTS sigs ('
+                             'root TEXT, path TEXT, mtime INTEGER, sig BLOB, sizes BLOB, PRIMARY KEY (root, path))')
+            self.con.execute('CREATE INDEX IF NOT EXISTS sigs_sig ON sigs (sig)')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.con.close()
+
+    def find(self, root: Path, name: str, maxlevel: int) -> Path | None:
+        rows = self.con.execute('SELECT path FROM dirs WHERE name = ? AND root = ? AND level BETWEEN 1 AND ? '
+                                'ORDER BY level, path', (name, os.path.abspath(root), maxlevel)).fetchall()
+        for path, in rows:
+            if os.path.isdir(path):
+                return Path(path)
+
+    def subdirs(self, root: str, path: str) -> dict[str, int | None]:
+        return dict(self.con.execute('SELECT path, mtime FROM dirs WHERE root = ? AND parent = ?', (root, path)))
+
+    def forget(self, root: str, path: str):
+        prefix = path + os.sep
+        for table in ('dirs', 'sigs'):
+            self.con.execute(f'DELETE FROM {table} WHERE root = ? AND (path = ? OR substr(path, 1, ?) = ?)',
+                             (root, path, len(prefix), prefix))
+
+    def refresh(self, root: Path, maxlevel: int, threads: int = WALK_THREADS) -> Iterator[Path]:
+        # Yields the folders that were not indexed yet, as the listings come in.
+        # Folders are stat'ed and listed on a thread pool, the database is only touched in this thread.
+        # Every listed folder is committed together with its subfolders,
+        # so the caller can stop as soon as it found what it was looking for.
+        root = os.path.abspath(root)
+        row = self.con.execute('SELECT mtime FROM dirs WHERE root = ? AND path = ?', (root, root)).fetchone()
+        todo = deque([(root, 0, row[0] if row else None)])
+        running = {}
+        pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='walker')
+        try:
+            while todo or running:
+                while todo and len(running) < threads * 2:
+                    path, level, mtime = todo.popleft()
+                    running[pool.submit(probe, path, mtime)] = path, level
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    path, level = running.pop(fut)
+                    try:
+                        mtime, listing = fut.result()
+                    except PermissionError:
+                        report.debug(f'{tp_text.permission_error} {path}')
+                        continue
+                    except (FileNotFoundError, NotADirectoryError):
+                        # gone. A missing root is more likely an unmounted share, its index is kept
+                        if path != root:
+                            with self.con:
+                                self.forget(root, path)
+                        continue
+                    except OSError as e:
+                        # network shares hiccup, the folder is looked at again next time
+                        report.debug(f'{tp_text.folder_error} {path}: {e}')
+                        continue
+
+                    known = self.subdirs(root, path)
+                    if listing is None:
+                        subdirs = known
+                        new = []
+                    else:
+                        new = [p for p in listing if p not in known]
+                        with self.con:
+                            for p in known.keys() - set(listing):
+                                self.forget(root, p)
+                            self.con.executemany('INSERT INTO dirs VALUES (?, ?, ?, ?, ?, NULL)',
+                                                 ((root, p, path, os.path.basename(p), level + 1) for p in new))
+                            self.con.execute('INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?, ?, ?)',
+                                             (root, path, os.path.dirname(path), os.path.basename(path), level,
+                                              mtime))
+                        subdirs = {p: known.get(p) for p in listing}
+
+                    for p in new:
+                        yield Path(p)
+
+                    if level + 1 < maxlevel:
+                        todo.extend((p, level + 1, m) for p, m in subdirs.items())
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def update_signatures(self, root: Path, maxlevel: int, threads: int = WALK_THREADS) -> Iterator[Path]:
+        # Signatures only follow the mtime of the folder itself.
+        # Files that change size in place or changes in deeper subfolders go unnoticed until the folder changes.
+        # Yields every folder it looked at. Each signature is committed on its own, so the caller can stop in between
+        root = os.path.abspath(root)
+        rows = self.con.execute('SELECT d.path, s.mtime FROM dirs d LEFT JOIN sigs s '
+                                'ON s.root = d.root AND s.path = d.path '
+                                'WHERE d.root = ? AND d.level BETWEEN 1 AND ?', (root, maxlevel)).fetchall()
+        paths = [path for path, _ in rows]
+        pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='walker')
+        try:
+            for path, res in zip(paths, pool.map(folder_sizes, paths, [mtime for _, mtime in rows])):
+                if res is not None:
+                    _, mtime, sizes = res
+                    sig, blob = signature(sizes)
+                    with self.con:
+                        self.con.execute('INSERT OR REPLACE INTO sigs VALUES (?, ?, ?, ?, ?)',
+                                         (root, path, mtime, sig, blob))
+                yield Path(path)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def find_content(self, root: Path, sizes: Iterable[int], maxlevel: int) -> list[Path]:
+        # Folders holding files of exactly these sizes
+        sig, blob = signature(sizes)
+        rows = self.con.execute('SELECT s.path, s.sizes FROM sigs s JOIN dirs d ON d.root = s.root AND d.path = s.path '
+                                'WHERE s.sig = ? AND s.root = ? AND d.level BETWEEN 1 AND ? ORDER BY d.level, s.path',
+                                (sig, os.path.abspath(root), maxlevel)).fetchall()
+        return [Path(path) for path, sizes in rows if sizes == blob and os.path.isdir(path)]
+
+
+def signature(sizes: Iterable[int]) -> tuple[bytes, bytes]:
+    # sha1 of the sorted sizes for the lookup, the sorted sizes themselves to rule out collisions
+    blob = array('Q', sorted(sizes)).tobytes()
+    return sha1(blob).digest(), blob
+
+
+def folder_sizes(path: str, known_mtime: int | None) -> tuple[str, int, list[int]] | None:
+    # None when the folder is gone or unchanged
+    try:
+        mtime = os.stat(path).st_mtime_ns
+        if mtime == known_mtime:
+            return
+        return path, mtime, [size for _, size, _ in scanfiles(path, hidden_dirs=True)]
+    except OSError:
+        return
+
+
+def probe(path: str, mtime: int | None) -> tuple[int, list[str] | None]:
+    # Listing is None when the mtime did not change
+    new_mtime = os.stat(path).st_mtime_ns
+    if new_mtime == mtime:
+        return new_mtime, None
+    with os.scandir(path) as it:
+        return new_mtime, [entry.path for entry in it if entry.is_dir()]
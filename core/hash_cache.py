@@ -0,0 +1,87 @@
+import os
+import time
+import sqlite3
+from pathlib import Path
+
+from core.utils import store_path
+
+HASH_LEN = 20
+MAX_AGE = 90 * 24 * 3600
+
+
+def split_hashes(blob: bytes) -> list[bytes]:
+    return [blob[i:i + HASH_LEN] for i in range(0, len(blob), HASH_LEN)]
+
+
+class HashCache:
+    # Piece hashes of the pieces that lie entirely inside one file.
+    # They only depend on the file content and on where the file starts relative to the piece boundaries.
+    def __init__(self, db_path: Path = None):
+        self.con = sqlite3.connect(db_path or store_path('hash_cache.sqlite'))
+        with self.con:
+            self.con.execute('CREATE TABLE IF NOT EXISTS file_hashes ('
+                             'path TEXT, piece_size INTEGER, offset INTEGER, size INTEGER, mtime INTEGER, '
+                             'used REAL, hashes BLOB, PRIMARY KEY (path, piece_size, offset))')
+            # checkpoints used to hold only the unbroken run of pieces from the start. They are disposable
+            columns = [row[1] for row in self.con.execute('PRAGMA table_info(checkpoints)')]
+            if columns and 'done' not in columns:
+                self.con.execute('DROP TABLE checkpoints')
+            self.con.execute('CREATE TABLE IF NOT EXISTS checkpoints ('
+                             'folder TEXT PRIMARY KEY, layout TEXT, used REAL, done BLOB, pieces BLOB)')
+            for table in ('file_hashes', 'checkpoints'):
+                self.con.execute(f'DELETE FROM {table} WHERE used < ?', (time.time() - MAX_AGE,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.con.close()
+
+    @staticmethod
+    def key(path: Path, piece_size: int, offset: int) -> tuple[str, int, int]:
+        return os.path.abspath(path), piece_size, offset % piece_size
+
+    def get(self, path: Path, piece_size: int, offset: int, size: int, mtime: int) -> list[bytes] | None:
+        key = self.key(path, piece_size, offset)
+        row = self.con.execute('SELECT size, mtime, hashes FROM file_hashes '
+                               'WHERE path = ? AND piece_size = ? AND offset = ?', key).fetchone()
+        if not row or row[:2] != (size, mtime):
+            return None
+        with self.con:
+            self.con.execute('UPDATE file_hashes SET used = ? WHERE path = ? AND piece_size = ? AND offset = ?',
+                             (time.time(), *key))
+        return split_hashes(row[2])
+
+    def file_mtime(self, path: Path) -> int | None:
+        # mtime of the file when it was last hashed
+        return self.con.execute('SELECT max(mtime) FROM file_hashes WHERE path = ?',
+                                (os.path.abspath(path),)).fetchone()[0]
+
+    def put(self, path: Path, piece_size: int, offset: int, size: int, mtime: int, hashes: list[bytes]):
+        with self.con:
+            self.con.execute('INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             (*self.key(path, piece_size, offset), size, mtime, time.time(), b''.join(hashes)))
+
+    def get_checkpoint(self, folder: Path, layout: str) -> dict[int, bytes]:
+        # the finished pieces by index
+        row = self.con.execute('SELECT layout, done, pieces FROM checkpoints WHERE folder = ?',
+                               (os.path.abspath(folder),)).fetchone()
+        if not row or row[0] != layout:
+            return {}
+        done = row[1]
+        indices = (i for i in range(len(done) * 8) if done[i >> 3] & (0x80 >> (i & 7)))
+        return dict(zip(indices, split_hashes(row[2])))
+
+    def put_checkpoint(self, folder: Path, layout: str, pieces: dict[int, bytes]):
+        # Any set of pieces, as parallel lanes finish them out of order. done is a bitmap of their indices
+        done = bytearray((max(pieces, default=-1) >> 3) + 1)
+        for i in pieces:
+            done[i >> 3] |= 0x80 >> (i & 7)
+        with self.con:
+            self.con.execute('INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?)',
+                             (os.path.abspath(folder), layout, time.time(), bytes(done),
+                              b''.join(pieces[i] for i in sorted(pieces))))
+
+    def drop_checkpoint(self, folder: Path):
+        with self.con:
+            self.con.execute('DELETE FROM checkpoints WHERE folder = ?', (os.path.abspath(folder),))
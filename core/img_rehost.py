@@ -1,12 +1,15 @@
 from enum import Enum, member
 import requests
 
+# (connect, read) in seconds. Hosts fetch the image themselves before they answer
+REHOST_TIMEOUT = (10, 60)
+
 
 def ra_rehost(img_link, key):
     url = "https://thesungod.xyz/api/image/rehost_new"
     data = {'api_key': key,
             'link': img_link}
-    r = requests.post(url, data=data)
+    r = requests.post(url, data=data, timeout=REHOST_TIMEOUT)
     return r.json()['link']
 
 
@@ -14,7 +17,7 @@ def ptpimg_rehost(img_link, key):
     url = "https://ptpimg.me/"
     data = {'api_key': key,
             'link-upload': img_link}
-    r = requests.post(url + 'upload.php', data=data)
+    r = requests.post(url + 'upload.php', data=data, timeout=REHOST_TIMEOUT)
     rj = r.json()[0]
     return f"{url}{rj['code']}.{rj['ext']}"
 
@@ -23,7 +26,7 @@ def imgbb_rehost(img_link, key):
     url = 'https://api.imgbb.com/1/upload'
     data = {'key': key,
             'image': img_link}
-    r = requests.post(url, data=data)
+    r = requests.post(url, data=data, timeout=REHOST_TIMEOUT)
     return r.json()['data']['url']
 
 
@@ -0,0 +1,118 @@
+import os
+import queue
+import threading
+from pathlib import Path
+from collections import defaultdict
+from typing import Callable, Iterator, Iterable, Any
+
+# concurrent readers per device
+HDD_SLOTS = 1
+SSD_SLOTS = 4
+UNKNOWN_SLOTS = 2
+
+_DONE = object()
+
+
+def is_rotational(dev: int) -> bool | None:
+    try:
+        base = Path(f'/sys/dev/block/{os.major(dev)}:{os.minor(dev)}')
+    except AttributeError:  # no os.major on Windows
+        return None
+
+    # partitions have their queue info in the parent device
+    for q in (base / 'queue', base / '..' / 'queue'):
+        try:
+            return (q / 'rotational').read_text().strip() == '1'
+        except OSError:
+            continue
+
+
+class DeviceScheduler:
+    def __init__(self, hdd_slots=HDD_SLOTS, ssd_slots=SSD_SLOTS, unknown_slots=UNKNOWN_SLOTS):
+        self.hdd_slots = hdd_slots
+        self.ssd_slots = ssd_slots
+        self.unknown_slots = unknown_slots
+        self._limits: dict[int, int] = {}
+
+    def limit(self, dev: int) -> int:
+        if dev not in self._limits:
+            rotational = is_rotational(dev)
+            if rotational is None:
+                self._limits[dev] = self.unknown_slots
+            else:
+                self._limits[dev] = self.hdd_slots if rotational else self.ssd_slots
+        return self._limits[dev]
+
+    def lanes(self, items: Iterable, path_of: Callable[[Any], Path], max_lanes: int = None) -> list[list]:
+        # Group items by device and split every group into as many sequential lanes as the device allows.
+        # With max_lanes, the devices with the most lanes give some up first.
+        # Beyond one lane per device, devices share lanes.
+        devices = {}
+        groups = defaultdict(list)
+        for item in items:
+            path = path_of(item)
+            if path not in devices:
+                devices[path] = path.stat().st_dev
+            groups[devices[path]].append(item)
+
+        if max_lanes and len(groups) > max_lanes:
+            shared = [[] for _ in range(max_lanes)]
+            for n, group in enumerate(groups.values()):
+                shared[n % max_lanes].extend(group)
+            return shared
+
+        counts = {dev: min(self.limit(dev), len(group)) for dev, group in groups.items()}
+        while max_lanes and sum(counts.values()) > max_lanes:
+            dev = max(counts, key=counts.get)
+            counts[dev] -= 1
+
+        lanes = []
+        for dev, group in groups.items():
+            size = -(-len(group) // counts[dev])
+            lanes.extend(group[i:i + size] for i in range(0, len(group), size))
+        return lanes
+
+    @staticmethod
+    def run(lanes: list[list], work: Callable[[list], Iterator]) -> Iterator:
+        # Every lane gets its own thread. Results are yielded as they arrive.
+        if len(lanes) == 1:
+            yield from work(lanes[0])
+            return
+
+        results = queue.Queue()
+        stop = threading.Event()
+
+        def lane_runner(lane: list):
+            gen = work(lane)
+            try:
+                for item in gen:
+                    if stop.is_set():
+                        break
+                    results.put((item, None))
+            except Exception as e:
+                results.put((None, e))
+            finally:
+                gen.close()
+                results.put(_DONE)
+
+        threads = [threading.Thread(target=lane_runner, args=(lane,), daemon=True) for lane in lanes]
+        for t in threads:
+            t.start()
+        try:
+            running = len(threads)
+            while running:
+                res = results.get()
+                if res is _DONE:
+                    running -= 1
+                    continue
+                item, exc = res
+                if exc:
+                    raise exc
+                yield item
+        finally:
+            stop.set()
+            for t in threads:
+                t.join()
+
+
+scheduler = DeviceScheduler()
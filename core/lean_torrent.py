@@ -1,27 +1,399 @@
+import os
 import math
+import time
+import random
+import atexit
+import threading
+from bisect import bisect_right
 from hashlib import sha1
 from pathlib import Path
-from multiprocessing import pool
+from itertools import accumulate
+from collections import deque, defaultdict
+from typing import Iterable, Iterator, Callable
+from concurrent.futures import ThreadPoolExecutor, Future
 
-from core.utils import scantree
+from core import tp_text
+from core.utils import scanfiles, uni_t_table
+from core.hash_cache import HashCache, HASH_LEN
+from core.io_sched import scheduler
+
+# Upper limits for piece data that is read but not yet hashed
+MAX_IN_FLIGHT_BYTES = 2 ** 26
+MAX_IN_FLIGHT_PIECES = 4 * (os.cpu_count() or 1)
+# pieces per file that are hashed to confirm reused piece hashes, besides the first and the last one
+REUSE_CHECK_SAMPLE = 2
+# page cache hints are given on platforms that support them
+FADVISE = hasattr(os, 'posix_fadvise')
+READAHEAD = 2 ** 23
+# seconds between progress reports
+PROGRESS_INTERVAL = .5
+# seconds between hashing checkpoints
+CHECKPOINT_INTERVAL = 30
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def hash_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(thread_name_prefix='hasher')
+            atexit.register(shutdown_executor)
+        return _executor
+
+
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(cancel_futures=True)
+            _executor = None
+
+
+class HashingInterrupted(Exception):
+    pass
+
+
+class CacheUse:
+    # Estimate of the page cache that is held by readers that give posix_fadvise hints
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.resident = 0
+        self.peak = 0
+
+    def change(self, n: int):
+        with self._lock:
+            self.resident += n
+            self.peak = max(self.peak, self.resident)
+
+
+class HashProgress:
+    def __init__(self, total_bytes: int, total_pieces: int, callback: Callable[['HashProgress'], None] = None):
+        self._lock = threading.Lock()
+        self.callback = callback
+        self.total_bytes = total_bytes
+        self.total_pieces = total_pieces
+        self.bytes_done = 0
+        self.pieces_done = 0
+        self.bytes_hashed = 0
+        self.io_time = .0
+        self.hash_time = .0
+        self.started = time.monotonic()
+        self._published = .0
+
+    def skip(self, pieces: int, size: int):
+        with self._lock:
+            self.pieces_done += pieces
+            self.bytes_done += size
+
+    def add_io(self, seconds: float):
+        with self._lock:
+            self.io_time += seconds
+
+    def add_piece(self, size: int, seconds: float):
+        with self._lock:
+            self.pieces_done += 1
+            self.bytes_done += size
+            self.bytes_hashed += size
+            self.hash_time += seconds
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self) -> float:
+        # bytes per second
+        return self.bytes_hashed / self.elapsed if self.elapsed else .0
+
+    @property
+    def eta(self) -> float | None:
+        if self.rate:
+            return (self.total_bytes - self.bytes_done) / self.rate
+
+    def publish(self, force=False):
+        now = time.monotonic()
+        if self.callback and (force or now - self._published >= PROGRESS_INTERVAL):
+            self._published = now
+            self.callback(self)
+
+
+class PieceReader:
+    def __init__(self, files: list[tuple[Path, int]], piece_size: int, cache_use: CacheUse = None,
+                 progress: HashProgress = None):
+        self.files = files
+        self.piece_size = piece_size
+        self.starts = [0, *accumulate(size for _, size in files)]
+        self.total_size = self.starts.pop()
+        self.cache_use = cache_use if FADVISE else None
+        self.progress = progress
+        self._f = None
+        self._f_index = None
+        self._read_to = None
+        self._cached_to = 0
+        self._dropped_to = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    @property
+    def piece_count(self) -> int:
+        return math.ceil(self.total_size / self.piece_size)
+
+    def piece_len(self, index: int) -> int:
+        return min(self.piece_size, self.total_size - index * self.piece_size)
+
+    def file_index(self, offset: int) -> int:
+        return bisect_right(self.starts, offset) - 1
+
+    def pieces_in_file(self, index: int) -> range:
+        start = self.starts[index]
+        end = start + self.files[index][1]
+        return range(start // self.piece_size, math.ceil(end / self.piece_size))
+
+    def inner_pieces(self, index: int) -> range:
+        # full length pieces that lie entirely inside the file
+        start = self.starts[index]
+        end = start + self.files[index][1]
+        return range(math.ceil(start / self.piece_size), end // self.piece_size)
+
+    def segments(self, index: int) -> Iterator[tuple[int, int, int]]:
+        # (file index, offset in file, length) of every file part in the piece
+        start = index * self.piece_size
+        length = self.piece_len(index)
+        pos = 0
+        f_index = self.file_index(start)
+        while pos < length:
+            _, size = self.files[f_index]
+            f_offset = start + pos - self.starts[f_index]
+            n = min(size - f_offset, length - pos)
+            if n > 0:
+                yield f_index, f_offset, n
+                pos += n
+            f_index += 1
+
+    def read_into(self, index: int, buf: bytearray) -> memoryview:
+        started = time.perf_counter()
+        view = memoryview(buf)[:self.piece_len(index)]
+        pos = 0
+        for f_index, f_offset, n in self.segments(index):
+            self._read(f_index, f_offset, view[pos:pos + n])
+            pos += n
+
+        if self.progress:
+            self.progress.add_io(time.perf_counter() - started)
+        return view
+
+    def _read(self, f_index: int, offset: int, view: memoryview):
+        end = offset + len(view)
+        try:
+            f = self._open(f_index)
+            if f.tell() != offset:
+                f.seek(offset)
+            while view:
+                n = f.readinto(view)
+                if not n:
+                    raise EOFError(self.files[f_index][0])
+                view = view[n:]
+        except OSError as e:
+            # read errors like EIO have no filename. The torrent offset tells which file failed
+            e.offset = self.starts[f_index] + offset
+            raise
+        if self.cache_use:
+            self._advise(f.fileno(), offset, end)
+
+    @property
+    def _read_ahead(self) -> int:
+        return max(0, self._cached_to - self._dropped_to)
+
+    def _advise(self, fd: int, offset: int, end: int):
+        # Hints only cover what this reader reads itself, other readers may be working on the same file.
+        # What has been read is dropped. Reading ahead only starts once reads follow on from each other.
+        before = self._read_ahead
+        if offset != self._read_to:
+            # unused read-ahead of the previous run is left alone, and no longer counted
+            self._dropped_to = self._cached_to = offset
+        else:
+            ahead = min(end + max(READAHEAD, self.piece_size), self.files[self._f_index][1])
+            start = max(self._cached_to, end)
+            if ahead > start:
+                os.posix_fadvise(fd, start, ahead - start, os.POSIX_FADV_WILLNEED)
+                self._cached_to = ahead
+        os.posix_fadvise(fd, self._dropped_to, end - self._dropped_to, os.POSIX_FADV_DONTNEED)
+        self._dropped_to = end
+        self._read_to = end
+        self.cache_use.change(self._read_ahead - before)
+
+    def _open(self, f_index: int):
+        if f_index != self._f_index:
+            self.close()
+            self._f = self.files[f_index][0].open('rb', buffering=0)
+            self._f_index = f_index
+        return self._f
+
+    def close(self):
+        if self._f:
+            if self.cache_use:
+                # everything that was read is dropped already
+                self.cache_use.change(-self._read_ahead)
+            self._f.close()
+        self._f = None
+        self._f_index = None
+        self._read_to = None
+        self._cached_to = 0
+        self._dropped_to = 0
+
+
+def piece_digest(view: memoryview) -> bytes:
+    return sha1(view).digest()
+
+
+def timed_piece_digest(view: memoryview, progress: HashProgress) -> bytes:
+    started = time.perf_counter()
+    digest = sha1(view).digest()
+    progress.add_piece(len(view), time.perf_counter() - started)
+    return digest
+
+
+def hash_pieces(reader: PieceReader, indices: Iterable[int], window: int) -> Iterator[bytes]:
+    # Each in-flight piece owns one buffer. A buffer is only refilled after the hash that uses it is collected.
+    executor = hash_executor()
+    buffers = []
+    in_flight: deque[Future] = deque()
+    try:
+        for n, index in enumerate(indices):
+            if len(in_flight) >= window:
+                yield in_flight.popleft().result()
+            if len(buffers) < window:
+                buffers.append(bytearray(reader.piece_size))
+            view = reader.read_into(index, buffers[n % window])
+            if reader.progress:
+                in_flight.append(executor.submit(timed_piece_digest, view, reader.progress))
+            else:
+                in_flight.append(executor.submit(piece_digest, view))
+        while in_flight:
+            yield in_flight.popleft().result()
+    finally:
+        for fut in in_flight:
+            fut.cancel()
+
+
+def hash_by_device(files: list[tuple[Path, int]], piece_size: int, indices: list[int], window: int,
+                   cache_use: CacheUse = None, progress: HashProgress = None) -> Iterator[tuple[int, bytes]]:
+    # (index, hash) in no particular order. Every device is read in parallel with its own readers.
+    locator = PieceReader(files, piece_size)
+    # no more lanes than window, or the pieces in flight would exceed it
+    lanes = scheduler.lanes(indices, lambda i: files[locator.file_index(i * piece_size)][0], max_lanes=window)
+    lane_window = max(1, window // max(1, len(lanes)))
+
+    def work(lane: list[int]):
+        with PieceReader(files, piece_size, cache_use, progress) as reader:
+            yield from zip(lane, hash_pieces(reader, lane, lane_window))
+
+    yield from scheduler.run(lanes, work)
+
+
+def piece_keys(reader: PieceReader, names: list[tuple[str, ...]]) -> Iterator[tuple]:
+    # identifies the data of a piece by file name, file size and position in the file
+    for i in range(reader.piece_count):
+        yield tuple((names[f], reader.files[f][1], offset, n) for f, offset, n in reader.segments(i))
+
+
+def norm_parts(parts: Iterable[str]) -> tuple[str, ...]:
+    return tuple(part.translate(uni_t_table) for part in parts)
+
+
+def sample_pieces(reader: PieceReader, per_file: int) -> list[int]:
+    indices = set()
+    for i in range(len(reader.files)):
+        in_file = reader.pieces_in_file(i)
+        if len(in_file) <= per_file:
+            indices.update(in_file)
+        else:
+            indices.update(random.sample(in_file, per_file))
+    return sorted(indices)
+
+
+def verify_pieces(files: list[tuple[Path, int]], piece_size: int, pieces: bytes, sample: int = 0,
+                  window: int = MAX_IN_FLIGHT_PIECES, cache_use: CacheUse = None,
+                  stop: Callable[[], bool] = None) -> Path | None:
+    # returns the first file that doesn't match
+    for path, size in files:
+        try:
+            if path.stat().st_size != size:
+                return path
+        except OSError:
+            return path
+
+    with PieceReader(files, piece_size) as reader:
+        indices = sample_pieces(reader, sample) if sample else list(range(reader.piece_count))
+        window = max(1, min(window, MAX_IN_FLIGHT_BYTES // piece_size))
+        hashes = hash_by_device(files, piece_size, indices, window, cache_use)
+        try:
+            for i, piece_hash in hashes:
+                if piece_hash != pieces[i * HASH_LEN:(i + 1) * HASH_LEN]:
+                    return files[reader.file_index(i * piece_size)][0]
+                if stop and stop():
+                    raise HashingInterrupted(tp_text.check_interrupted)
+        except EOFError as e:
+            return e.args[0]
+        except OSError as e:
+            if (offset := getattr(e, 'offset', None)) is not None:
+                return files[reader.file_index(offset)][0]
+            if e.filename:
+                return Path(e.filename)
+            raise
+        finally:
+            hashes.close()
 
 
 class Torrent:
-    def __init__(self, path: Path):
+    def __init__(self, path: Path, cache: HashCache = None, stop: Callable[[], bool] = None, reference: dict = None,
+                 reference_time: int = None, cache_use: CacheUse = None,
+                 progress: Callable[[HashProgress], None] = None, max_pieces: int = MAX_IN_FLIGHT_PIECES,
+                 max_bytes: int = MAX_IN_FLIGHT_BYTES):
         self.path = path
+        self.cache = cache
+        self.cache_use = cache_use
+        self.progress = progress
+        self.stop = stop
+        self.reference = reference
+        self.reference_time = reference_time  # ns. Files changed after this don't reuse reference hashes
+        self.reused = 0
+        self.unhashed = set()  # reused pieces that were not hashed here
         self._file_list = []
+        self._mtimes = []
         self._total_size = 0
-        self._piece_size = None
+        self._piece_size = reference['piece length'] if reference else None
+        self.max_pieces = max_pieces
+        self.max_bytes = max_bytes
         self.data = None
-        self._pool = pool.ThreadPool()
         self.generate_data()
 
     def scan_files(self):
         if self.path.is_dir():
-            for p in scantree(self.path):
-                fsize = p.stat().st_size
-                self._total_size += fsize
-                self._file_list.append((p, fsize))
+            for rel, size, mtime in scanfiles(self.path):
+                self._total_size += size
+                self._file_list.append((self.path / rel, size))
+                self._mtimes.append(mtime)
+
+            if self.reference:
+                self.follow_reference_order()
+
+    def rel_names(self) -> list[tuple[str, ...]]:
+        return [norm_parts(p.relative_to(self.path).parts) for p, _ in self.file_list]
+
+    def follow_reference_order(self):
+        # files that are also in the reference keep its order, new files go last
+        ref_order = {norm_parts(fd['path']): i for i, fd in enumerate(self.reference['files'])}
+        names = self.rel_names()
+        order = sorted(range(len(names)), key=lambda i: (ref_order.get(names[i], len(ref_order)), i))
+        self._file_list = [self._file_list[i] for i in order]
+        self._mtimes = [self._mtimes[i] for i in order]
 
     @property
     def file_list(self) -> list[tuple[Path, int]]:
@@ -50,40 +422,133 @@ class Torrent:
 
         return self._piece_size
 
-    def file_objects(self):
-        for path, _ in self.file_list:
-            with path.open('rb') as f:
-                yield f
-
-    def file_chunks(self):
-        ps = self.piece_size
-        read_size = ps
-        chunks = []
-        chunks_size = 0
-        for f in self.file_objects():
-            for chunk in iter(lambda: f.read(read_size), b''):
-                chunks_size += len(chunk)
-                chunks.append(chunk)
-                if chunks_size == ps:
-                    yield chunks
-                    chunks_size = 0
-                    read_size = ps
-                    chunks = []
-                else:
-                    read_size = ps - chunks_size
-        if chunks_size:
-            yield chunks
-
-    @staticmethod
-    def list_hasher(chunks: list[bytes]):
-        h = sha1()
-        for chunk in chunks:
-            h.update(chunk)
-        return h.digest()
-
-    def file_hashes(self):
-        for chsum in self._pool.imap(self.list_hasher, self.file_chunks(), 10):
-            yield chsum
+    @property
+    def window(self) -> int:
+        window = max(1, self.max_bytes // self.piece_size)
+        if self.max_pieces:
+            window = min(window, self.max_pieces)
+        return window
+
+    @property
+    def max_buffered(self) -> int:
+        return self.window * self.piece_size
+
+    def cached_hashes(self, reader: PieceReader) -> dict[int, bytes]:
+        known = {}
+        for i, (path, size) in enumerate(self.file_list):
+            inner = reader.inner_pieces(i)
+            if not inner:
+                continue
+            hashes = self.cache.get(path, self.piece_size, reader.starts[i], size, self._mtimes[i])
+            if hashes and len(hashes) == len(inner):
+                known.update(zip(inner, hashes))
+        return known
+
+    def reused_hashes(self, reader: PieceReader) -> dict[int, bytes]:
+        ref_files = [(Path(*fd['path']), fd['length']) for fd in self.reference['files']]
+        ref_names = [norm_parts(fd['path']) for fd in self.reference['files']]
+        ref_reader = PieceReader(ref_files, self.piece_size)
+        ref_keys = {key: j for j, key in enumerate(piece_keys(ref_reader, ref_names))}
+        ref_pieces = self.reference['pieces']
+
+        unchanged = self.unchanged_files()
+        reused = {}
+        for i, key in enumerate(piece_keys(reader, self.rel_names())):
+            j = ref_keys.get(key)
+            if j is not None and all(f in unchanged for f, _, _ in reader.segments(i)):
+                reused[i] = ref_pieces[j * HASH_LEN:(j + 1) * HASH_LEN]
+
+        # Same names and sizes don't guarantee same content. Hash a few of the pieces per file to confirm,
+        # always the first and the last one, as that's where tags and padding are rewritten in place.
+        per_file = defaultdict(list)
+        for i in reused:
+            per_file[reader.file_index(i * self.piece_size)].append(i)
+        check = []
+        for pieces in per_file.values():
+            ends = {pieces[0], pieces[-1]}
+            rest = [i for i in pieces if i not in ends]
+            check.extend(ends)
+            check.extend(random.sample(rest, min(len(rest), REUSE_CHECK_SAMPLE)))
+        check.sort()
+
+        bad_files = set()
+        for i, piece_hash in zip(check, hash_pieces(reader, check, self.window)):
+            if piece_hash != reused[i]:
+                bad_files.update(f for f, _, _ in reader.segments(i))
+
+        if bad_files:
+            reused = {i: h for i, h in reused.items() if not any(f in bad_files for f, _, _ in reader.segments(i))}
+        self.reused = len(reused)
+        self.unhashed = reused.keys() - set(check)
+        return reused
+
+    def unchanged_files(self) -> set[int]:
+        # Files that weren't modified after the reference .torrent was made or after they were last hashed.
+        # Without a reference time that can't be told, so nothing qualifies.
+        if self.reference_time is None:
+            return set()
+        unchanged = set()
+        for i, ((path, _), mtime) in enumerate(zip(self.file_list, self._mtimes)):
+            if mtime > self.reference_time:
+                continue
+            if self.cache and (hashed := self.cache.file_mtime(path)) is not None and mtime > hashed:
+                continue
+            unchanged.add(i)
+        return unchanged
+
+    def store_hashes(self, reader: PieceReader, hashes: list[bytes]):
+        # Reused hashes are only trusted for this build, a file with any of them is not cached
+        for i, (path, size) in enumerate(self.file_list):
+            inner = reader.inner_pieces(i)
+            if inner and not self.unhashed.intersection(inner):
+                self.cache.put(path, self.piece_size, reader.starts[i], size, self._mtimes[i],
+                               hashes[inner.start:inner.stop])
+
+    @property
+    def layout(self) -> str:
+        h = sha1(str(self.piece_size).encode())
+        for (path, size), mtime in zip(self.file_list, self._mtimes):
+            h.update(f'{path.relative_to(self.path)}|{size}|{mtime}'.encode())
+        return h.hexdigest()
+
+    def checkpoint(self, known: dict[int, bytes]):
+        self.cache.put_checkpoint(self.path, self.layout, known)
+
+    def file_hashes(self) -> list[bytes]:
+        with PieceReader(self.file_list, self.piece_size, self.cache_use) as reader:
+            known = {}
+            if self.reference:
+                known.update(self.reused_hashes(reader))
+            if self.cache:
+                known.update(self.cache.get_checkpoint(self.path, self.layout))
+                known.update(self.cached_hashes(reader))
+            todo = [i for i in range(reader.piece_count) if i not in known]
+            progress = HashProgress(reader.total_size, reader.piece_count, self.progress)
+            progress.skip(len(known), sum(reader.piece_len(i) for i in known))
+
+            last_checkpoint = time.monotonic()
+            hashes = hash_by_device(self.file_list, self.piece_size, todo, self.window, self.cache_use, progress)
+            try:
+                for i, piece_hash in hashes:
+                    known[i] = piece_hash
+                    progress.publish()
+                    if self.stop and self.stop():
+                        if self.cache:
+                            self.checkpoint(known)
+                        raise HashingInterrupted(tp_text.hash_interrupted)
+                    if self.cache and time.monotonic() - last_checkpoint > CHECKPOINT_INTERVAL:
+                        self.checkpoint(known)
+                        last_checkpoint = time.monotonic()
+            finally:
+                hashes.close()
+            progress.publish(force=True)
+
+            hashes = [known[i] for i in range(reader.piece_count)]
+            if self.cache:
+                self.store_hashes(reader, hashes)
+                self.cache.drop_checkpoint(self.path)
+
+        return hashes
 
     def generate_data(self):
         info = {
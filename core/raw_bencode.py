@@ -0,0 +1,72 @@
+from typing import Iterator
+
+# Works on the encoded bytes, so values that don't change are copied as is instead of being decoded and encoded again.
+# That keeps info hashes byte exact, whatever the encoder that made the .torrent did.
+
+
+def value_end(data: bytes, pos: int) -> int:
+    c = data[pos]
+    if c == 0x69:  # i
+        return data.index(b'e', pos) + 1
+    if c in (0x64, 0x6c):  # d, l
+        pos += 1
+        while data[pos] != 0x65:  # e
+            pos = value_end(data, pos)
+        return pos + 1
+    if 0x30 <= c <= 0x39:
+        colon = data.index(b':', pos)
+        return colon + 1 + int(data[pos:colon])
+    raise ValueError(f'Invalid bencode at {pos}')
+
+
+def dict_items(data: bytes, start: int = 0) -> Iterator[tuple[bytes, int, int, int]]:
+    # key, key start, value start, value end
+    if data[start] != 0x64:
+        raise ValueError(f'No dict at {start}')
+    pos = start + 1
+    while data[pos] != 0x65:
+        v_start = value_end(data, pos)
+        key = data[data.index(b':', pos) + 1:v_start]
+        v_end = value_end(data, v_start)
+        yield key, pos, v_start, v_end
+        pos = v_end
+
+
+def dict_value(data: bytes, key: bytes, start: int = 0) -> tuple[int, int] | None:
+    for k, _, v_start, v_end in dict_items(data, start):
+        if k == key:
+            return v_start, v_end
+
+
+def info_span(data: bytes) -> tuple[int, int]:
+    span = dict_value(data, b'info')
+    if not span:
+        raise KeyError('info')
+    return span
+
+
+def encode_key(key: bytes) -> bytes:
+    return b'%d:%s' % (len(key), key)
+
+
+def splice_dict(data: bytes, changes: dict[bytes, bytes | None]) -> bytes:
+    # Copy of the dict in data with some values replaced by already encoded ones. None removes a key.
+    view = memoryview(data)
+    todo = sorted(changes.items(), reverse=True)
+    out = [b'd']
+    for key, k_start, v_start, v_end in dict_items(data):
+        while todo and todo[-1][0] < key:
+            k, v = todo.pop()
+            if v is not None:
+                out.extend((encode_key(k), v))
+        if todo and todo[-1][0] == key:
+            _, v = todo.pop()
+            if v is not None:
+                out.extend((view[k_start:v_start], v))
+        else:
+            out.append(view[k_start:v_end])
+    for k, v in reversed(todo):
+        if v is not None:
+            out.extend((encode_key(k), v))
+    out.append(b'e')
+    return b''.join(out)
@@ -0,0 +1,37 @@
+import os
+import time
+import sqlite3
+from pathlib import Path
+
+from core.utils import store_path
+
+
+class Registry:
+    # Torrents that Transplant handled, by tracker id and by info hash, and the folder that has their data
+    def __init__(self, db_path: Path = None):
+        self.con = sqlite3.connect(db_path or store_path('registry.sqlite'))
+        with self.con:
+            self.con.execute('CREATE TABLE IF NOT EXISTS torrents ('
+                             'tracker TEXT, tor_id INTEGER, info_hash TEXT, folder TEXT, added REAL, '
+                             'PRIMARY KEY (tracker, tor_id))')
+            self.con.execute('CREATE INDEX IF NOT EXISTS torrents_hash ON torrents (info_hash)')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.con.close()
+
+    def add(self, tracker: str, tor_id: int, info_hash: str | None, folder: Path):
+        with self.con:
+            self.con.execute('INSERT OR REPLACE INTO torrents VALUES (?, ?, ?, ?, ?)',
+                             (tracker, int(tor_id), info_hash and info_hash.lower(), os.path.abspath(folder),
+                              time.time()))
+
+    def folder(self, tracker: str = None, tor_id: int = None, info_hash: str = None) -> Path | None:
+        rows = self.con.execute('SELECT folder FROM torrents WHERE (tracker = ? AND tor_id = ?) OR info_hash = ? '
+                                'ORDER BY added DESC',
+                                (tracker, tor_id and int(tor_id), info_hash and info_hash.lower())).fetchall()
+        for folder, in rows:
+            if os.path.isdir(folder):
+                return Path(folder)
@@ -12,17 +12,35 @@ split_warn = 'Split -> Unknown. Please edit on RED'
 dtor_saved = 'New .torrent saved to:'
 dtor_deleted = '.torrent deleted from scan dir'
 missing = "Can't find:"
+found_by_content = 'Torrent folder found by file sizes:'
+size_mismatch = 'Size mismatch ({} instead of {} bytes):'
 no_log = "No logs found"
 log_count_wrong = 'Torrent has {} logs, {} found'
 new_tor = 'Generating new torrent'
+hash_progress = '{pct:.0f}% - {done}/{total} pieces - {speed:.1f} MiB/s - ETA {eta} - I/O {io:.1f}s, SHA1 {sha:.1f}s'
+hash_mem = 'Hashing buffers: {} MiB'
+page_cache_use = 'Page cache used while reading: {} MiB max'
+pieces_reused = 'Reused {} of {} piece hashes from source .torrent'
+hash_interrupted = 'Hashing stopped. It will resume from here next time'
+check_interrupted = 'Piece check stopped'
 tor_downed = '.torrent downloaded from {}'
 f_checked = 'Files checked'
+checking_pieces = 'Checking pieces:'
+pieces_mismatch = "Data doesn't match .torrent:"
 rehost = 'Img rehost:'
 no_img = 'No img in source'
 img_white = 'source img whitelisted'
 trying = 'trying'
 rehost_failed = "Failed. Using source url"
 permission_error = 'Permission error. Folder skipped: '
+folder_error = 'Folder could not be read. Skipped:'
+job_timeout = 'Job took longer than {} min. Abandoned'
+rate_limited = 'rate limit, waited'
+retrying = 'retrying in {:.1f}s ({}/{})'
+wait_too_long = 'tracker asks to wait {:.0f}s. Not retrying'
+upl_landed = 'Upload arrived after all'
+upl_replay = 'Upload did not arrive. Sending it again'
+not_registered = 'Torrent not registered:'
 # post check
 log_score_dif = 'Log scores different: {} - {}'
 merged = 'Probably merged into an existing group'
@@ -1,8 +1,7 @@
+import time
 import logging
+import sqlite3
 from pathlib import Path
-from hashlib import sha1
-from typing import Iterator
-from urllib.parse import urlparse
 
 from bcoding import bencode, bdecode
 
@@ -10,32 +9,31 @@ from gazelle import upload
 from gazelle.tracker_data import TR, Encoding, BAD_RED_ENCODINGS, ArtistType
 from gazelle.api_classes import sleeve, BaseApi, OpsApi
 from gazelle.torrent_info import TorrentInfo
-from core import utils, tp_text
+from core import utils, tp_text, raw_bencode
 from core.info_2_upl import TorInfo2UplData
-from core.lean_torrent import Torrent
+from core.lean_torrent import Torrent, CacheUse, HashProgress, HashingInterrupted, verify_pieces
+from core.hash_cache import HashCache
+from core.folder_index import FolderIndex
+from core.registry import Registry
+from core.dtor_scan import DtorMeta, parse_dtor
 
 report = logging.getLogger('tr.core')
 
-
-def subdirs_gen(path: Path, maxlevel=1, level=1) -> Iterator[Path]:
-    for p in path.iterdir():
-        if p.is_dir():
-            yield p
-            if level < maxlevel:
-                try:
-                    yield from subdirs_gen(p, maxlevel=maxlevel, level=level + 1)
-                except PermissionError:
-                    report.debug(f'{tp_text.permission_error} {p}')
-                    continue
+# pieces per file that are checked to confirm a folder found by its file sizes
+CONTENT_CHECK_SAMPLE = 2
 
 
 class JobCreationError(Exception):
     pass
 
 
+class JobTimeout(Exception):
+    pass
+
+
 class Job:
     def __init__(self, src_tr=None, tor_id=None, src_dom=None, dtor_path=None, scanned=False, dest_group=None,
-                 new_dtor=False, dest_trs=None):
+                 new_dtor=False, dest_trs=None, dtor_meta=None):
 
         self.src_tr = src_tr
         self.tor_id = tor_id
@@ -47,10 +45,12 @@ class Job:
 
         self.info_hash = None
         self.display_name = None
-        self.dtor_dict = None
+        self.dtor_name = None
+        self._dtor_bytes = None
+        self._dtor_dict = None
 
         if self.dtor_path:
-            self.parse_dtorrent(self.dtor_path)
+            self.parse_dtorrent(self.dtor_path, dtor_meta)
             self.display_name = self.dtor_path.stem
 
         if src_dom:
@@ -68,33 +68,32 @@ class Job:
         if not self.dest_trs:
             self.dest_trs = ~self.src_tr
 
-    def parse_dtorrent(self, path: Path):
-        torbytes = path.read_bytes()
-        try:
-            self.dtor_dict = bdecode(torbytes)
-            info = self.dtor_dict['info']
-        except (KeyError, TypeError):
-            raise JobCreationError(tp_text.not_dtor)
+    def parse_dtorrent(self, path: Path, meta: DtorMeta = None):
+        meta = meta or parse_dtor(path)
+        if meta.error:
+            raise JobCreationError(meta.error)
 
-        source = info.get('source', '').replace('PTH', 'RED')
-        self.info_hash = sha1(bencode(info)).hexdigest()
+        self.info_hash = meta.info_hash
+        self.dtor_name = meta.name
+        if meta.src_tr:
+            self.src_tr = meta.src_tr
 
-        if source:
-            try:
-                self.src_tr = TR[source]
-                return
-            except KeyError:
-                pass
+    @property
+    def dtor_bytes(self) -> bytes | None:
+        # scanned .torrents are read again when needed, so a long job list doesn't hold them all in memory
+        if self._dtor_bytes is None and self.dtor_path:
+            self._dtor_bytes = self.dtor_path.read_bytes()
+        return self._dtor_bytes
 
-        announce = self.dtor_dict.get('announce')
-        if not announce:
-            return
-        parsed = urlparse(announce)
-        if parsed.hostname:
-            for t in TR:
-                if parsed.hostname in t.tracker.lower():
-                    self.src_tr = t
-                    break
+    @dtor_bytes.setter
+    def dtor_bytes(self, value: bytes):
+        self._dtor_bytes = value
+
+    @property
+    def dtor_dict(self) -> dict | None:
+        if self._dtor_dict is None and self.dtor_bytes:
+            self._dtor_dict = bdecode(self.dtor_bytes)
+        return self._dtor_dict
 
     def __hash__(self):
         return int(self.info_hash or f'{hash((self.src_tr, self.tor_id)):x}', 16)
@@ -104,41 +103,50 @@ class Job:
 
 
 class Transplanter:
-    def __init__(self, key_dict, data_dir=None, deep_search=False, deep_search_level=None, dtor_save_dir=None,
-                 save_dtors=False, del_dtors=False, file_check=True, rel_descr_templ=None, rel_descr_own_templ=None,
-                 add_src_descr=True, src_descr_templ=None, img_rehost=False, whitelist=None, post_compare=False):
+    def __init__(self, key_dict, data_dir=None, deep_search=False, deep_search_level=None, content_search=False,
+                 dtor_save_dir=None, save_dtors=False, del_dtors=False, file_check=True, piece_check=False,
+                 piece_sample=0, rel_descr_templ=None, rel_descr_own_templ=None, add_src_descr=True,
+                 src_descr_templ=None, img_rehost=False, whitelist=None, post_compare=False, spare_page_cache=False,
+                 job_timeout=0, info_cache_ttl=24, stop_check=None):
 
-        self.api_map = {trckr: sleeve(trckr, key=key_dict[trckr]) for trckr in TR}
+        self.api_map = {trckr: sleeve(trckr, key=key_dict[trckr], info_ttl=info_cache_ttl * 3600) for trckr in TR}
         self.data_dir: Path = data_dir
         self.deep_search = deep_search
         self.deep_search_level = deep_search_level
+        self.content_search = content_search
         self.dtor_save_dir: Path | None = dtor_save_dir
         self.save_dtors = save_dtors
         self.del_dtors = del_dtors
         self.file_check = file_check
+        self.piece_check = piece_check
+        self.piece_sample = piece_sample
         self.post_compare = post_compare
-
-        if self.deep_search:
-            self.subdir_store = {}
-            self.subdir_gen = subdirs_gen(self.data_dir, maxlevel=self.deep_search_level)
+        self.spare_page_cache = spare_page_cache
+        self.stop_check = stop_check
+        self.job_timeout = job_timeout  # minutes, 0 is no limit
+        self.deadline = None
 
         self.inf_2_upl = TorInfo2UplData(img_rehost, whitelist, rel_descr_templ, rel_descr_own_templ,
                                          add_src_descr, src_descr_templ)
         self.job = None
         self.tor_info: TorrentInfo | None = None
         self._torrent_folder_path = None
+        self._manifest = None
         self.lrm = False
         self.local_is_stripped = False
 
     def do_your_job(self, job: Job) -> bool:
         self.reset()
         self.job = job
+        # Checked between steps. Requests have their own timeouts, so no step can hang for long.
+        self.deadline = time.monotonic() + self.job_timeout * 60 if self.job_timeout else None
 
         report.info(f"{self.job.src_tr.name} {self.job.display_name or self.job.tor_id}")
 
         src_api = self.api_map[self.job.src_tr]
         if not self.get_torinfo(src_api):
             return False
+        self.checkpoint()
 
         if not self.job.display_name:
             self.job.display_name = self.tor_info.folder_name
@@ -146,6 +154,8 @@ class Transplanter:
 
         if self.fail_conditions():
             return False
+        self.checkpoint()
+        self.register(self.job.src_tr, self.tor_info.tor_id, self.job.info_hash)
 
         upl_files = upload.Files()
 
@@ -156,26 +166,31 @@ class Transplanter:
 
         saul_goodman = True
         for dest_tr in self.job.dest_trs:
+            # never abandon an upload halfway, only before it starts
+            self.checkpoint()
 
             dest_api = self.api_map[dest_tr]
             data_dict = upl_data.upl_dict(dest_tr, self.job.dest_group)
 
             files_list = upl_files.files_list(dest_api.announce, dest_tr.name, u_strip=self.strip_tor)
+            dtor_bytes, dest_hash = upl_files.dtors[0].encoded(dest_api.announce, dest_tr.name, self.strip_tor)
 
             report.info(f"{tp_text.uploading} {dest_tr.name}")
             try:
-                new_id, new_group, new_url = dest_api.upload(data_dict, files_list)
+                new_id, new_group, new_url = dest_api.upload(data_dict, files_list, dest_hash)
                 report.log(25, f"{tp_text.upl_success} {new_url}")
             except Exception:
                 saul_goodman = False
                 report.exception(f"{tp_text.upl_fail}")
                 continue
 
+            self.register(dest_tr, new_id, dest_hash)
+
             if self.post_compare:
                 self.compare_upl_info(src_api, dest_api, new_id)
 
             if self.save_dtors:
-                self.save_dtorrent(upl_files, new_url)
+                self.save_dtorrent(dtor_bytes, new_url)
                 report.info(f"{tp_text.dtor_saved} {self.dtor_save_dir}")
 
         if not saul_goodman:
@@ -187,9 +202,18 @@ class Transplanter:
 
         return True
 
+    def checkpoint(self):
+        if self.deadline and time.monotonic() > self.deadline:
+            raise JobTimeout(tp_text.job_timeout.format(self.job_timeout))
+
+    def should_stop(self) -> bool:
+        return bool(self.stop_check and self.stop_check()) or bool(self.deadline and time.monotonic() > self.deadline)
+
     def reset(self):
+        self.deadline = None
         self.tor_info = None
         self._torrent_folder_path = None
+        self._manifest = None
         self.lrm = False
         self.local_is_stripped = False
 
@@ -252,33 +276,91 @@ class Transplanter:
                 self._torrent_folder_path = p
                 self.local_is_stripped = True
 
+            elif p := self.registered_folder():
+                self._torrent_folder_path = p
+                self.local_is_stripped = self.lrm and p.name == stripped_folder
+
             elif self.deep_search:
                 self.search_deep(tor_folder_name, stripped_folder)
 
+            if not self._torrent_folder_path and self.content_search:
+                self.search_content()
+
         return self._torrent_folder_path
 
-    def search_deep(self, tor_folder_name: str, stripped_folder: str):
-        if tor_folder_name in self.subdir_store:
-            self._torrent_folder_path = self.subdir_store[tor_folder_name]
-            return
-        if self.lrm and stripped_folder in self.subdir_store:
-            self._torrent_folder_path = self.subdir_store[stripped_folder]
-            self.local_is_stripped = True
+    def registered_folder(self) -> Path | None:
+        with Registry() as registry:
+            return registry.folder(self.job.src_tr.name, self.tor_info.tor_id, self.job.info_hash)
+
+    def register(self, tracker: TR, tor_id: int, info_hash: str | None):
+        # Only when the data folder is known. The registry is a lookup aid, it never fails a job
+        if not self._torrent_folder_path:
             return
+        try:
+            with Registry() as registry:
+                registry.add(tracker.name, tor_id, info_hash, self._torrent_folder_path)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            report.debug(f'{tp_text.not_registered} {e}')
 
-        for p in self.subdir_gen:
-            if p.name == tor_folder_name:
-                self._torrent_folder_path = p
-                break
-            elif self.lrm and p.name == stripped_folder:
-                self._torrent_folder_path = p
-                self.local_is_stripped = True
-                break
-            else:
-                self.subdir_store[p.name] = p
+    def search_deep(self, tor_folder_name: str, stripped_folder: str):
+        names = {tor_folder_name: False}
+        if self.lrm:
+            names[stripped_folder] = True
+
+        with FolderIndex() as index:
+            for name, stripped in names.items():
+                if p := index.find(self.data_dir, name, self.deep_search_level):
+                    self._torrent_folder_path = p
+                    self.local_is_stripped = stripped
+                    return
+
+            for p in index.refresh(self.data_dir, self.deep_search_level):
+                self.checkpoint()
+                if p.name in names:
+                    self._torrent_folder_path = p
+                    self.local_is_stripped = names[p.name]
+                    return
+
+    def search_content(self):
+        # a renamed torrent folder can still be found by the sizes of its files
+        level = self.deep_search_level if self.deep_search else 1
+        with FolderIndex() as index:
+            for _ in index.refresh(self.data_dir, level):
+                self.checkpoint()
+            for _ in index.update_signatures(self.data_dir, level):
+                self.checkpoint()
+            candidates = index.find_content(self.data_dir, (fd['size'] for fd in self.tor_info.file_list), level)
+
+        for p in candidates:
+            self._torrent_folder_path = p
+            self._manifest = None
+            self.local_is_stripped = False
+            if self.confirm_content():
+                report.info(f"{tp_text.found_by_content} {p}")
+                return
+
+        self._torrent_folder_path = None
+        self._manifest = None
+        self.local_is_stripped = False
+
+    def confirm_content(self) -> bool:
+        info = self.source_dtor(self.api_map[self.job.src_tr])['info']
+        files = []
+        for fd in info.get('files', ()):
+            full_p = self.check_path(Path(*fd['path']))
+            if full_p is None:
+                return False
+            files.append((full_p, fd['length']))
+
+        try:
+            return verify_pieces(files, info['piece length'], info['pieces'], CONTENT_CHECK_SAMPLE,
+                                 stop=self.should_stop) is None
+        except HashingInterrupted:
+            self.checkpoint()
+            raise
 
     def compare_upl_info(self, src_api: BaseApi, dest_api: BaseApi, new_id: int):
-        new_tor_info = dest_api.torrent_info(id=new_id)
+        new_tor_info = dest_api.torrent_info(fresh=True, id=new_id)
 
         if self.tor_info.haslog:
             score_1 = self.tor_info.log_score
@@ -313,16 +395,19 @@ class Transplanter:
 
     def get_dtor(self, files: upload.Files, src_api: BaseApi):
         if self.job.new_dtor:
-            files.add_dtor(self.create_new_torrent())
+            files.add_dtor(self.create_new_torrent(self.source_dtor(src_api)['info']))
 
-        elif self.job.dtor_dict:
-            files.add_dtor(self.job.dtor_dict)
         else:
-            dtor_bytes = src_api.request('download', id=self.tor_info.tor_id)
+            self.source_dtor(src_api)
+            files.add_dtor(self.job.dtor_bytes)
+
+    def source_dtor(self, src_api: BaseApi) -> dict:
+        if not self.job.dtor_bytes:
+            self.job.dtor_bytes = src_api.request('download', id=self.tor_info.tor_id)
             report.info(tp_text.tor_downed.format(self.job.src_tr.name))
-            dtor_dict = bdecode(dtor_bytes)
-            self.job.dtor_dict = dtor_dict
-            files.add_dtor(dtor_dict)
+            self.job.dtor_name = self.job.dtor_dict['info']['name']
+
+        return self.job.dtor_dict
 
     NOT_RIPLOG = ('audiochecker', 'aucdtect', 'accurip')
 
@@ -363,12 +448,46 @@ class Transplanter:
 
         return True
 
-    def create_new_torrent(self) -> dict:
+    def create_new_torrent(self, src_info: dict = None) -> dict:
         report.info(tp_text.new_tor)
-        t = Torrent(self.torrent_folder_path)
+        reference = src_info if src_info and 'files' in src_info else None
+        # Source hashes are only reused for files that are older than the source torrent
+        reference_time = self.tor_info.upload_time
+        cache_use = CacheUse() if self.spare_page_cache else None
+        with HashCache() as cache:
+            try:
+                t = Torrent(self.torrent_folder_path, cache=cache, stop=self.should_stop, reference=reference,
+                            reference_time=reference_time, cache_use=cache_use, progress=self.hash_progress)
+            except HashingInterrupted:
+                self.checkpoint()
+                raise
+        report.debug(tp_text.hash_mem.format(t.max_buffered >> 20))
+        if cache_use:
+            report.debug(tp_text.page_cache_use.format(cache_use.peak >> 20))
+        if reference:
+            report.debug(tp_text.pieces_reused.format(t.reused, len(t.data['info']['pieces']) // 20))
 
         return t.data
 
+    @staticmethod
+    def hash_progress(p: HashProgress):
+        eta = p.eta
+        msg = tp_text.hash_progress.format(
+            pct=100 * p.bytes_done / p.total_bytes if p.total_bytes else 100,
+            done=p.pieces_done, total=p.total_pieces, speed=p.rate / 2 ** 20,
+            eta='?' if eta is None else f'{int(eta) // 60}:{int(eta) % 60:02}',
+            io=p.io_time, sha=p.hash_time)
+        report.info(msg, extra={'progress': True})
+
+    @property
+    def manifest(self) -> dict[str, int]:
+        # relative path -> size of every file in the torrent folder, from a single walk.
+        # Files that can't be listed are left out, check_path looks for those on its own.
+        if self._manifest is None:
+            self._manifest = {rel: size for rel, size, _ in
+                              utils.scanfiles(self.torrent_folder_path, hidden_dirs=True, skip_errors=True)}
+        return self._manifest
+
     def check_path(self, rel_path: Path) -> Path | None:
         stripped = Path(str(rel_path).translate(utils.uni_t_table))
 
@@ -376,30 +495,79 @@ class Transplanter:
         if has_lrm:
             self.lrm = True
 
-        full_p = self.torrent_folder_path / rel_path
-        if full_p.exists():
-            return full_p
-        elif has_lrm:
-            fp_stripped = self.torrent_folder_path / stripped
-            if fp_stripped.exists():
-                self.local_is_stripped = True
-                return fp_stripped
+        candidates = (rel_path, stripped) if has_lrm else (rel_path,)
+        for p in candidates:
+            if str(p) in self.manifest:
+                break
+        else:
+            # the manifest is case-sensitive, the file system may not be. And it lacks what it couldn't read
+            for p in candidates:
+                try:
+                    if (self.torrent_folder_path / p).exists():
+                        break
+                except OSError:
+                    continue
+            else:
+                return
+
+        if p is stripped:
+            self.local_is_stripped = True
+        return self.torrent_folder_path / p
+
+    def local_size(self, full_p: Path) -> int:
+        size = self.manifest.get(str(full_p.relative_to(self.torrent_folder_path)))
+        return full_p.stat().st_size if size is None else size
 
     def check_files(self) -> bool:
         if self.job.new_dtor:
             return True
 
-        for info_path in self.tor_info.file_paths():
-            if self.check_path(info_path) is None:
-                report.error(f"{tp_text.missing} {info_path}")
+        for fd in self.tor_info.file_list:
+            full_p = self.check_path(fd['path'])
+            if full_p is None:
+                report.error(f"{tp_text.missing} {fd['path']}")
+                return False
+            if (size := self.local_size(full_p)) != fd['size']:
+                report.error(f"{tp_text.size_mismatch.format(size, fd['size'])} {fd['path']}")
                 return False
 
         report.info(tp_text.f_checked)
+        if self.piece_check:
+            return self.check_pieces()
+
+        return True
+
+    def check_pieces(self) -> bool:
+        info = self.source_dtor(self.api_map[self.job.src_tr])['info']
+        report.info(tp_text.checking_pieces)
+        files = []
+        for fd in info.get('files', ()):
+            rel_path = Path(*fd['path'])
+            full_p = self.check_path(rel_path)
+            if full_p is None:
+                report.error(f"{tp_text.missing} {rel_path}")
+                return False
+            files.append((full_p, fd['length']))
+
+        cache_use = CacheUse() if self.spare_page_cache else None
+        try:
+            bad_file = verify_pieces(files, info['piece length'], info['pieces'], self.piece_sample,
+                                     cache_use=cache_use, stop=self.should_stop)
+        except HashingInterrupted:
+            self.checkpoint()
+            raise
+        if cache_use:
+            report.debug(tp_text.page_cache_use.format(cache_use.peak >> 20))
+        if bad_file:
+            report.log(42, tp_text.fail)
+            report.error(f"{tp_text.pieces_mismatch} {bad_file}")
+            return False
+
+        report.log(22, tp_text.done)
         return True
 
-    def save_dtorrent(self, files: upload.Files, comment: str = None):
-        dtor = files.dtors[0].as_dict(u_strip=self.strip_tor)
+    def save_dtorrent(self, dtor_bytes: bytes, comment: str = None):
         if comment:
-            dtor['comment'] = comment
+            dtor_bytes = raw_bencode.splice_dict(dtor_bytes, {b'comment': bencode(comment)})
         file_path = (self.dtor_save_dir / self.tor_info.folder_name).with_suffix('.torrent')
-        file_path.write_bytes(bencode(dtor))
+        file_path.write_bytes(dtor_bytes)
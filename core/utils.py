@@ -1,15 +1,42 @@
+import os
 import re
 import traceback
 from pathlib import Path
 from typing import Iterator
 
+STORE_DIR = Path.home() / '.transplant'
 
-def scantree(path: Path) -> Iterator[Path]:
-    for p in path.iterdir():
-        if p.is_dir() and not p.name.startswith('.'):
-            yield from scantree(p)
-        else:
-            yield p
+
+def store_path(name: str) -> Path:
+    STORE_DIR.mkdir(exist_ok=True)
+    return STORE_DIR / name
+
+
+def scanfiles(path: Path | str, prefix: str = '', hidden_dirs=False,
+              skip_errors=False) -> Iterator[tuple[str, int, int]]:
+    # (relative path, size, mtime_ns) for every file below path.
+    # DirEntry knows the file type without a stat call, and on Windows it has the stat result as well.
+    # skip_errors leaves out what can't be read, like dangling symlinks and folders without permission.
+    try:
+        it = os.scandir(path)
+    except OSError:
+        if skip_errors:
+            return
+        raise
+    with it:
+        for entry in it:
+            rel = prefix + entry.name
+            if entry.is_dir():
+                if hidden_dirs or not entry.name.startswith('.'):
+                    yield from scanfiles(entry.path, rel + os.sep, hidden_dirs, skip_errors)
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                if skip_errors:
+                    continue
+                raise
+            yield rel, st.st_size, st.st_mtime_ns
 
 
 def multi_replace(src_txt, replace_map, *extra_maps):
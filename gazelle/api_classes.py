@@ -3,7 +3,7 @@ import time
 import base64
 import logging
 from hashlib import sha256
-from collections import deque
+from itertools import count
 from http.cookiejar import LWPCookieJar, LoadError
 
 import requests
@@ -12,29 +12,51 @@ from requests.exceptions import JSONDecodeError
 from core import tp_text
 from gazelle.torrent_info import TorrentInfo
 from gazelle.tracker_data import TR
+from gazelle.multipart import MultipartBody
+from gazelle import rate_limit, retry
+from gazelle.info_cache import InfoCache
 
 
 class RequestFailure(Exception):
     pass
 
+
+class TransientFailure(RequestFailure):
+    # Worth another try later. retry_after is what the server asked for, if anything
+    def __init__(self, msg, retry_after: float = None, throttled=False):
+        super().__init__(msg)
+        self.retry_after = retry_after
+        self.throttled = throttled
+
 report = logging.getLogger('tr.api')
 
+# (connect, read) timeouts in seconds per endpoint type
+TIMEOUTS = {
+    'info': (10, 30),
+    'download': (10, 60),
+    'upload': (10, 180),
+}
+# by ajax action or page, the rest is 'info'
+ENDPOINT_TYPES = {
+    'download': 'download',
+    'riplog': 'download',
+    'upload': 'upload',
+}
+# seconds a cached torrent info response is used for
+INFO_TTL = 24 * 3600
+
 
 class BaseApi:
-    def __init__(self, tracker: TR, **kwargs):
+    def __init__(self, tracker: TR, info_ttl: float = INFO_TTL, **kwargs):
         assert tracker in TR, 'Unknown Tracker'  # TODO uitext
         self.tr = tracker
+        self.info_ttl = info_ttl
         self.url = self.tr.site
         self.session = requests.Session()
-        self.last_x_reqs = deque([.0], maxlen=self.tr.req_limit)
+        self.limiter = rate_limit.limiter(self.tr, kwargs.get('key'))
         self.authenticate(**kwargs)
         self._account_info = None
 
-    def _rate_limit(self):
-        t = time.time() - self.last_x_reqs[0]
-        if t <= 10:
-            time.sleep(10 - t)
-
     def authenticate(self, _):
         return NotImplementedError
 
@@ -57,10 +79,48 @@ class BaseApi:
         url = self.url + url_suffix + '.php'
         report.debug(f'{self.tr.name} {url_suffix} {kwargs}')
         req_method = 'POST' if data or files else 'GET'
+        headers = None
+        if files:
+            data = MultipartBody(data, files)
+            headers = {'Content-Type': data.content_type}
+
+        kind = kwargs.get('action', url_suffix)
+        policy = retry.policy(kind)
+        for attempt in count(1):
+            try:
+                return self._send(req_method, url, kwargs, data, headers, TIMEOUTS[ENDPOINT_TYPES.get(kind, 'info')])
+            except TransientFailure as e:
+                # uploads are never replayed blindly, _uploader decides
+                if kind == 'upload' or attempt >= policy.attempts:
+                    raise
+                self.back_off(kind, e, policy, attempt)
+
+    def back_off(self, kind: str, e: TransientFailure, policy: retry.RetryPolicy, attempt: int):
+        if policy.gives_up(e.retry_after):
+            # still keep everyone off the tracker for as long as it asked
+            self.limiter.pause(e.retry_after)
+            raise TransientFailure(f'{e}. {tp_text.wait_too_long.format(e.retry_after)}', e.retry_after,
+                                   e.throttled) from e
+        delay = policy.delay(attempt, e.retry_after)
+        report.warning(f'{self.tr.name} {kind}: {e}. {tp_text.retrying.format(delay, attempt, policy.attempts)}')
+        if e.throttled or e.retry_after is not None:
+            # the tracker wants everyone to wait, not just this request
+            self.limiter.pause(delay)
+        else:
+            time.sleep(delay)
+
+    def _send(self, req_method: str, url: str, params: dict, data, headers: dict | None,
+              timeout: tuple[float, float]) -> dict | bytes:
+        if (waited := self.limiter.acquire()) > 0:
+            report.debug(f'{self.tr.name} {tp_text.rate_limited} {waited:.2f}s')
+        try:
+            r = self.session.request(req_method, url, params=params, data=data, headers=headers, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise TransientFailure(str(e))
 
-        self._rate_limit()
-        r = self.session.request(req_method, url, params=kwargs, data=data, files=files)
-        self.last_x_reqs.append(time.time())
+        if r.status_code in retry.TRANSIENT_STATUS:
+            raise TransientFailure(f'HTTP {r.status_code}', retry.retry_after(r.headers.get('Retry-After')),
+                                   throttled=r.status_code == 429)
 
         try:
             r_dict = r.json()
@@ -74,22 +134,57 @@ class BaseApi:
         if status == 'success':
             return r_dict['response']
         elif status == 'failure':
+            if retry.THROTTLE_REGEX.search(str(r_dict['error'])):
+                raise TransientFailure(r_dict['error'], throttled=True)
             raise RequestFailure(r_dict['error'])
 
         raise RequestFailure(r_dict)
 
-    def torrent_info(self, **kwargs) -> TorrentInfo:
-        r = self.request('torrent', **kwargs)
+    def torrent_info(self, fresh=False, **kwargs) -> TorrentInfo:
+        # By id or hash. fresh skips the cache, but still updates it
+        if not self.info_ttl:
+            return TorrentInfo(self.request('torrent', **kwargs), self.tr)
+
+        with InfoCache() as cache:
+            r = None if fresh else cache.get(self.tr.name, self.info_ttl, kwargs.get('id'), kwargs.get('hash'))
+            if r is None:
+                r = self.request('torrent', **kwargs)
+                cache.put(self.tr.name, r, kwargs.get('hash'))
         return TorrentInfo(r, self.tr)
 
-    def upload(self, upl_data: dict, files: list):
-        return self._uploader(upl_data, files)
+    def upload(self, upl_data: dict, files: list, info_hash: str = None):
+        return self._uploader(upl_data, files, info_hash)
 
-    def _uploader(self, data: dict, files: list) -> dict:
-        r = self.request('upload', data=data, files=files)
+    def _uploader(self, data: dict, files: list, info_hash: str = None) -> dict:
+        # An upload that failed on the way can still have landed.
+        # It's only sent again once the tracker confirmed it doesn't know the info hash.
+        policy = retry.policy('upload')
+        for attempt in count(1):
+            try:
+                r = self.request('upload', data=data, files=files)
+                break
+            except TransientFailure as e:
+                if not info_hash or attempt >= policy.attempts:
+                    raise
+                self.back_off('upload', e, policy, attempt)
+                if r := self.landed(info_hash):
+                    report.info(tp_text.upl_landed)
+                    break
+                report.info(tp_text.upl_replay)
 
         return self.upl_response_handler(r)
 
+    def landed(self, info_hash: str) -> dict | None:
+        # The upload response for a torrent that's already there. A lookup that can't answer raises
+        try:
+            r = self.request('torrent', hash=info_hash)
+        except TransientFailure:
+            raise
+        except RequestFailure:
+            return None
+        tor_key, group_key = self.UPL_ID_KEYS
+        return {tor_key: r['torrent']['id'], group_key: r['group']['id']}
+
     def upl_response_handler(self, r):
         raise NotImplementedError
 
@@ -152,9 +247,9 @@ class CookieApi(BaseApi):
 
         return super().request(url_addon, data=data, files=files, **kwargs)
 
-    def _uploader(self, data: dict, files: list):
+    def _uploader(self, data: dict, files: list, info_hash: str = None):
         data['submit'] = True
-        super()._uploader(data, files)
+        super()._uploader(data, files, info_hash)
 
     def upl_response_handler(self, r: requests.Response):
         if 'torrents.php' not in r.url:
@@ -166,7 +261,7 @@ class CookieApi(BaseApi):
 class HtmlApi(CookieApi):
 
     def get_account_info(self):
-        r = self.session.get(self.url + 'index.php')
+        r = self.session.get(self.url + 'index.php', timeout=TIMEOUTS['info'])
         return {
             'authkey': re.search(r"authkey=(.+?)[^a-zA-Z0-9]", r.text).group(1),
             'passkey': re.search(r"passkey=(.+?)[^a-zA-Z0-9]", r.text).group(1),
@@ -178,16 +273,18 @@ class HtmlApi(CookieApi):
 
 
 class RedApi(KeyApi):
-    def __init__(self, key=None):
-        super().__init__(TR.RED, key=key)
+    UPL_ID_KEYS = 'torrentid', 'groupid'
+
+    def __init__(self, key=None, **kwargs):
+        super().__init__(TR.RED, key=key, **kwargs)
 
-    def _uploader(self, data: dict, files: list) -> (int, int, str):
+    def _uploader(self, data: dict, files: list, info_hash: str = None) -> (int, int, str):
         try:
             unknown = data.pop('unknown')
         except KeyError:
             unknown = False
 
-        torrent_id, group_id = super()._uploader(data, files)
+        torrent_id, group_id = super()._uploader(data, files, info_hash)
 
         if unknown:
             try:
@@ -198,16 +295,17 @@ class RedApi(KeyApi):
         return torrent_id, group_id, self.url + f"torrents.php?id={group_id}&torrentid={torrent_id}"
 
     def upl_response_handler(self, r: dict) -> (int, int):
-        return r.get('torrentid'), r.get('groupid')
+        return tuple(r.get(k) for k in self.UPL_ID_KEYS)
 
 
 class OpsApi(KeyApi):
-    def __init__(self, key=None):
-        super().__init__(TR.OPS, key=f"token {key}")
+    UPL_ID_KEYS = 'torrentId', 'groupId'
+
+    def __init__(self, key=None, **kwargs):
+        super().__init__(TR.OPS, key=f"token {key}", **kwargs)
 
     def upl_response_handler(self, r):
-        group_id = r.get('groupId')
-        torrent_id = r.get('torrentId')
+        torrent_id, group_id = (r.get(k) for k in self.UPL_ID_KEYS)
 
         return torrent_id, group_id, self.url + f"torrents.php?id={group_id}&torrentid={torrent_id}"
 
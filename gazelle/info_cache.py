@@ -0,0 +1,52 @@
+import json
+import time
+import zlib
+import sqlite3
+from pathlib import Path
+
+from core.utils import store_path
+
+# responses older than this are pruned, whatever the ttl
+MAX_AGE = 30 * 24 * 3600
+
+
+class InfoCache:
+    # torrent action responses by tracker and torrent id, zlib'ed json.
+    # Info hashes point to the id, so a lookup by hash finds what was fetched by id and vice versa.
+    def __init__(self, db_path: Path = None):
+        self.con = sqlite3.connect(db_path or store_path('torrent_info.sqlite'))
+        with self.con:
+            self.con.execute('CREATE TABLE IF NOT EXISTS info ('
+                             'tracker TEXT, tor_id INTEGER, fetched REAL, resp BLOB, PRIMARY KEY (tracker, tor_id))')
+            self.con.execute('CREATE TABLE IF NOT EXISTS hashes ('
+                             'tracker TEXT, info_hash TEXT, tor_id INTEGER, PRIMARY KEY (tracker, info_hash))')
+            self.con.execute('DELETE FROM info WHERE fetched < ?', (time.time() - MAX_AGE,))
+            self.con.execute('DELETE FROM hashes WHERE NOT EXISTS '
+                             '(SELECT 1 FROM info i WHERE i.tracker = hashes.tracker AND i.tor_id = hashes.tor_id)')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.con.close()
+
+    def get(self, tracker: str, max_age: float, tor_id: int = None, info_hash: str = None) -> dict | None:
+        if tor_id is None:
+            row = self.con.execute('SELECT tor_id FROM hashes WHERE tracker = ? AND info_hash = ?',
+                                   (tracker, info_hash and info_hash.lower())).fetchone()
+            if not row:
+                return None
+            tor_id = row[0]
+        row = self.con.execute('SELECT resp FROM info WHERE tracker = ? AND tor_id = ? AND fetched >= ?',
+                               (tracker, int(tor_id), time.time() - max_age)).fetchone()
+        if row:
+            return json.loads(zlib.decompress(row[0]))
+
+    def put(self, tracker: str, resp: dict, info_hash: str = None):
+        tor_id = int(resp['torrent']['id'])
+        hashes = {h.lower() for h in (info_hash, resp['torrent'].get('infoHash')) if h}
+        with self.con:
+            self.con.execute('INSERT OR REPLACE INTO info VALUES (?, ?, ?, ?)',
+                             (tracker, tor_id, time.time(), zlib.compress(json.dumps(resp).encode())))
+            self.con.executemany('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?)',
+                                 ((tracker, h, tor_id) for h in hashes))
@@ -0,0 +1,65 @@
+import os
+from pathlib import Path
+from typing import Iterator
+
+CHUNK_SIZE = 2 ** 16
+
+
+def quote(value: str) -> bytes:
+    return value.replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A').encode()
+
+
+class MultipartBody:
+    # multipart/form-data that is read while it is sent.
+    # Files can be bytes or Paths, Paths are only opened when their part goes out.
+    # The length is known up front, so requests sends it with a Content-Length instead of chunked.
+    # Every iteration starts over, so a body can be sent again.
+    def __init__(self, data: dict = None, files: list = None):
+        self.boundary = os.urandom(16).hex()
+        self.parts: list[tuple[bytes, bytes | Path]] = []
+
+        for name, value in (data or {}).items():
+            if isinstance(value, (str, bytes)) or not hasattr(value, '__iter__'):
+                value = [value]
+            for v in value:
+                if v is None:
+                    continue
+                if not isinstance(v, bytes):
+                    v = str(v).encode()
+                self.parts.append((self.header(name), v))
+
+        for name, (filename, content, content_type) in files or []:
+            self.parts.append((self.header(name, filename, content_type), content))
+
+        self.tail = f'--{self.boundary}--\r\n'.encode()
+
+    def header(self, name: str, filename: str = None, content_type: str = None) -> bytes:
+        header = b'--%s\r\nContent-Disposition: form-data; name="%s"' % (self.boundary.encode(), quote(name))
+        if filename:
+            header += b'; filename="%s"' % quote(filename)
+        if content_type:
+            header += b'\r\nContent-Type: %s' % content_type.encode()
+        return header + b'\r\n\r\n'
+
+    @property
+    def content_type(self) -> str:
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        length = len(self.tail)
+        for header, content in self.parts:
+            size = content.stat().st_size if isinstance(content, Path) else len(content)
+            length += len(header) + size + 2
+        return length
+
+    def __iter__(self) -> Iterator[bytes]:
+        for header, content in self.parts:
+            yield header
+            if isinstance(content, Path):
+                with content.open('rb') as f:
+                    while chunk := f.read(CHUNK_SIZE):
+                        yield chunk
+            else:
+                yield content
+            yield b'\r\n'
+        yield self.tail
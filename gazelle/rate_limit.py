@@ -0,0 +1,129 @@
+import time
+import sqlite3
+import asyncio
+import threading
+from pathlib import Path
+from hashlib import sha256
+from collections import deque
+
+from gazelle.tracker_data import TR
+from core.utils import store_path
+
+# trackers allow req_limit requests per this many seconds
+WINDOW = 10
+# Slots are planned send times. Callers wake up a little late, and under load later than that,
+# which would squeeze the gap to the next group of requests. Slots are kept this much further apart.
+MARGIN = .25
+
+
+class RateLimiter:
+    # Sliding window over the times requests are sent.
+    # A caller reserves the first free slot under the lock and waits for it outside of it,
+    # so threads and asyncio tasks can share one limiter without exceeding the limit or queueing behind a sleeper.
+    def __init__(self, limit: int, window: float = WINDOW, margin: float = MARGIN):
+        self.limit = limit
+        self.window = window
+        self.span = window + margin
+        self.slots = deque()  # reserved send times, ascending. Later ones may lie in the future
+        self.lock = threading.Lock()
+        self.clock = time.monotonic
+        self.paused_until = 0.0
+        self.blocked = 0.0
+        self.waits = 0
+
+    def reserve(self) -> float:
+        # Seconds until the reserved slot
+        with self.lock:
+            now = self.clock()
+            slot = self.take_slot(now)
+            wait = slot - now
+            if wait > 0:
+                self.blocked += wait
+                self.waits += 1
+            return wait
+
+    def take_slot(self, now: float) -> float:
+        while self.slots and self.slots[0] <= now - self.span:
+            self.slots.popleft()
+        if len(self.slots) < self.limit:
+            slot = now
+        else:
+            slot = self.slots[-self.limit] + self.span
+        if self.slots:
+            slot = max(slot, self.slots[-1])
+        slot = max(slot, self.paused_until)
+        self.slots.append(slot)
+        return slot
+
+    def pause(self, seconds: float):
+        # No slots before then, for any caller. For when the tracker asks to back off
+        with self.lock:
+            self.pause_until(self.clock() + seconds)
+
+    def pause_until(self, until: float):
+        self.paused_until = max(self.paused_until, until)
+
+    def acquire(self) -> float:
+        # Blocks until a request may be sent, returns how long that took
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self) -> float:
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
+class SharedRateLimiter(RateLimiter):
+    # The window lives in a small SQLite table, so every Transplant process on this host paces against it.
+    # Wall clock time, as monotonic clocks don't compare between processes.
+    # BEGIN IMMEDIATE takes the write lock before reading, so two processes can't reserve the same slot.
+    def __init__(self, bucket: str, limit: int, window: float = WINDOW, margin: float = MARGIN,
+                 db_path: Path = None):
+        super().__init__(limit, window, margin)
+        self.bucket = bucket
+        self.clock = time.time
+        self.con = sqlite3.connect(db_path or store_path('rate_limit.sqlite'), timeout=60,
+                                   isolation_level=None, check_same_thread=False)
+        self.con.execute('CREATE TABLE IF NOT EXISTS slots (bucket TEXT, sent REAL)')
+        self.con.execute('CREATE INDEX IF NOT EXISTS slots_bucket ON slots (bucket, sent)')
+        self.con.execute('CREATE TABLE IF NOT EXISTS pauses (bucket TEXT PRIMARY KEY, until REAL)')
+
+    def take_slot(self, now: float) -> float:
+        self.con.execute('BEGIN IMMEDIATE')
+        try:
+            self.con.execute('DELETE FROM slots WHERE bucket = ? AND sent <= ?', (self.bucket, now - self.span))
+            row = self.con.execute('SELECT sent FROM slots WHERE bucket = ? ORDER BY sent DESC LIMIT 1 OFFSET ?',
+                                   (self.bucket, self.limit - 1)).fetchone()
+            slot = row[0] + self.span if row else now
+            paused = self.con.execute('SELECT until FROM pauses WHERE bucket = ?', (self.bucket,)).fetchone()
+            if paused:
+                slot = max(slot, paused[0])
+            self.con.execute('INSERT INTO slots VALUES (?, ?)', (self.bucket, slot))
+            self.con.execute('COMMIT')
+        except BaseException:
+            self.con.execute('ROLLBACK')
+            raise
+        return slot
+
+    def pause_until(self, until: float):
+        self.con.execute('INSERT INTO pauses VALUES (?, ?) '
+                         'ON CONFLICT (bucket) DO UPDATE SET until = max(until, excluded.until)', (self.bucket, until))
+
+
+_limiters: dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter(tracker: TR, key: str = None) -> RateLimiter:
+    # One limiter per tracker and account, shared by all API objects of the process and, through the store,
+    # by all processes. The key itself is not stored.
+    fingerprint = sha256(key.encode()).hexdigest()[:16] if key else ''
+    bucket = f'{tracker.name}:{fingerprint}'
+    with _limiters_lock:
+        if bucket not in _limiters:
+            _limiters[bucket] = SharedRateLimiter(bucket, tracker.req_limit)
+        return _limiters[bucket]
@@ -0,0 +1,51 @@
+import re
+import time
+import random
+from email.utils import parsedate_to_datetime
+
+# 'rate limit exceeded', 'too many requests' and the like in a failure response
+THROTTLE_REGEX = re.compile(r'rate.?limit|too many requests|slow down', re.I)
+TRANSIENT_STATUS = (429, 500, 502, 503, 504)
+
+
+class RetryPolicy:
+    # Exponential backoff with full jitter, unless the server said how long to wait.
+    # That is waited in full, gives_up tells when it's longer than this policy is willing to wait
+    def __init__(self, attempts: int, base: float = 2, cap: float = 120):
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+
+    def delay(self, attempt: int, retry_after: float = None) -> float:
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.cap, self.base * 2 ** (attempt - 1)))
+
+    def gives_up(self, retry_after: float = None) -> bool:
+        return retry_after is not None and retry_after > self.cap
+
+
+DEFAULT = RetryPolicy(4)
+# by ajax action or page. Uploads are not replayed by BaseApi.request, see BaseApi._uploader
+POLICIES = {
+    'upload': RetryPolicy(3, base=10),
+    'login': RetryPolicy(1),
+}
+
+
+def policy(kind: str) -> RetryPolicy:
+    return POLICIES.get(kind, DEFAULT)
+
+
+def retry_after(value: str | None) -> float | None:
+    # Retry-After is either seconds or an http date
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
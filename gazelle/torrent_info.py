@@ -1,6 +1,7 @@
 import html
 import re
 from pathlib import Path
+from datetime import datetime, timezone
 from typing import Iterator, Any
 
 from gazelle.tracker_data import TR, ReleaseType, ArtistType, Encoding
@@ -49,6 +50,15 @@ def unexape(thing: Any) -> Any:
         return thing
 
 
+def upload_time(value: str | None) -> int | None:
+    # gazelle gives the upload time as '2019-03-14 15:09:26', utc
+    try:
+        dt = datetime.strptime(value, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        return None
+    return int(dt.timestamp()) * 10 ** 9
+
+
 class TorrentInfo:
     def __init__(self, tr_resp: dict, src_tr: TR):
         self.grp_id: int | None = None
@@ -80,6 +90,7 @@ class TorrentInfo:
         self.folder_name: str | None = None
         self.uploader_id: int | None = None
         self.uploader: str | None = None
+        self.upload_time: int | None = None  # ns
 
         self.file_list: list | None = None
         self.unknown: bool = False
@@ -97,6 +108,8 @@ class TorrentInfo:
                 if value:
                     setattr(self, torinfo_name, value)
 
+        self.upload_time = upload_time(tr_resp['torrent'].get('time'))
+
         enc_str = tr_resp['torrent']['encoding']
         self.encoding = Encoding[enc_str]
         if self.encoding is Encoding.Other:
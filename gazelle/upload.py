@@ -1,9 +1,12 @@
 import logging
 from pathlib import Path
+from hashlib import sha1, sha256
 from bcoding import bencode, bdecode
 from gazelle.tracker_data import TR, ReleaseType, ArtistType, Encoding
 from core import tp_text
 from core .utils import uni_t_table
+from core.raw_bencode import info_span, splice_dict
+from gazelle.multipart import CHUNK_SIZE
 
 report = logging.getLogger('tr.upl')
 
@@ -122,66 +125,71 @@ class UploadData:
 
 class Dtor:
     def __init__(self, tor: bytes | dict | Path):
-        self.announce = None
-        self.source = None
+        # (announce, source, u_strip): (.torrent bytes, info hash)
+        self._encoded: dict[tuple[str, str, bool], tuple[bytes, str]] = {}
 
+        if isinstance(tor, Path):
+            tor = tor.read_bytes()
         if isinstance(tor, bytes):
-            self.t_info = bdecode(tor)['info']
+            start, end = info_span(tor)
+            self.raw_info = tor[start:end]
+            self.t_info = bdecode(self.raw_info)
         elif isinstance(tor, dict):
             self.t_info = tor['info']
-        elif isinstance(tor, Path):
-            self.t_info = bdecode(tor.read_bytes())['info']
+            self.raw_info = bencode(self.t_info)
         else:
             raise TypeError
 
-        if 'source' in self.t_info:
-            del self.t_info['source']
-
-        self.lrm = False
-
-        self.stripped_info = self.t_info.copy()
-        self.stripped_info['name'] = self.t_info['name'].translate(uni_t_table)
-        for fd in self.stripped_info['files']:
-            p_elements: list = fd['path']
-            fd['path'] = [e.translate(uni_t_table) for e in p_elements]
-        if self.stripped_info != self.t_info:
-            self.lrm = True
-
-    def as_bytes(self, u_strip=False):
-        return bencode(self.as_dict(u_strip))
-
-    def as_dict(self, u_strip=False):
-        tordict = {}
-        if self.announce:
-            tordict['announce'] = self.announce
-        if not self.lrm or not u_strip:
-            info = self.t_info
-        else:
-            info = self.stripped_info
-        if self.source:
-            info['source'] = self.source
-
-        tordict['info'] = info
-        return tordict
-
-    def trackerise(self, announce=None, source=None):
-        self.announce = announce
-        self.source = source
+        # encoded replacements for the unicode stripped version
+        self.stripped = {}
+        name = self.t_info['name']
+        if (stripped_name := name.translate(uni_t_table)) != name:
+            self.stripped[b'name'] = bencode(stripped_name)
+        if files := self.t_info.get('files'):
+            stripped_files = [{**fd, 'path': [e.translate(uni_t_table) for e in fd['path']]} for fd in files]
+            if stripped_files != files:
+                self.stripped[b'files'] = bencode(stripped_files)
+        self.lrm = bool(self.stripped)
+
+    def info_bytes(self, source: str = None, u_strip=False) -> bytes:
+        # original info with only source and, when stripping, the names replaced
+        changes = {b'source': bencode(source) if source else None}
+        if u_strip:
+            changes.update(self.stripped)
+        return splice_dict(self.raw_info, changes)
+
+    def encoded(self, announce: str = None, source: str = None, u_strip=False) -> tuple[bytes, str]:
+        # Encoded once per destination. Upload, info hash and saving share the result.
+        key = announce, source, u_strip and self.lrm
+        if key not in self._encoded:
+            info = self.info_bytes(source, u_strip)
+            tordict = {b'info': info}
+            if announce:
+                tordict[b'announce'] = bencode(announce)
+            self._encoded[key] = splice_dict(b'de', tordict), sha1(info).hexdigest()
+        return self._encoded[key]
 
 
 class Files:
     def __init__(self):
         self.dtors: list[Dtor] = []
-        self.logs: list[bytes] = []
+        self.logs: list[Path | bytes] = []
+        self.log_digests = set()
 
     def add_log(self, log: Path | bytes):
+        # Paths stay on disk until the upload streams them
         if isinstance(log, Path):
-            log = log.read_bytes()
+            digest = sha256()
+            with log.open('rb') as f:
+                while chunk := f.read(CHUNK_SIZE):
+                    digest.update(chunk)
         elif isinstance(log, bytes):
-            pass
+            digest = sha256(log)
         else:
             raise TypeError
-        if log not in self.logs:
+        digest = digest.digest()
+        if digest not in self.log_digests:
+            self.log_digests.add(digest)
             self.logs.append(log)
 
     def add_dtor(self, dtor):
@@ -200,8 +208,8 @@ class Files:
     def files_list(self, announce=None, source=None, u_strip=False) -> list:
         files = []
         for (field_name, i), dtor in zip(self.tor_field_names(), self.dtors):
-            dtor.trackerise(announce, source)
-            files.append((field_name, (f'blabla{i}.torrent', dtor.as_bytes(u_strip), 'application/x-bittorrent')))
+            dtor_bytes, _ = dtor.encoded(announce, source, u_strip)
+            files.append((field_name, (f'blabla{i}.torrent', dtor_bytes, 'application/x-bittorrent')))
 
         for log in self.logs:
             files.append(('logfiles[]', ('log.log', log, 'application/octet-stream')))
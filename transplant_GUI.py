@@ -1,10 +1,12 @@
 import sys
 import logging
+import multiprocessing
 from GUI import resources
 from GUI.misc_classes import Application
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # .torrent scanning uses worker processes
     sys.excepthook = lambda cls, ex, tb: logger.error('', exc_info=(cls, ex, tb))
 
     logger = logging.getLogger('tr.GUI')
@@ -5,7 +5,8 @@ from pathlib import Path
 from urllib.parse import urlparse, parse_qs
 from typing import Iterator
 
-from core.transplant import Transplanter, Job, JobCreationError
+from core.transplant import Transplanter, Job, JobCreationError, JobTimeout
+from core.dtor_scan import parse_dtors
 from core import tp_text
 from cli_config import cli_config
 from core.utils import tb_line_gen
@@ -14,11 +15,28 @@ from gazelle.tracker_data import TR
 
 
 class SlStreamHandler(logging.StreamHandler):
+    def __init__(self, stream=None):
+        super().__init__(stream)
+        self.progress_len = 0
+
     @staticmethod
     def make_msg(msg: str):
         return msg
 
+    def emit_progress(self, record: logging.LogRecord):
+        # progress lines overwrite each other
+        prefix = '\r' if self.progress_len else '\n'
+        msg = record.msg.ljust(self.progress_len)
+        self.progress_len = len(msg)
+        self.stream.write(prefix + self.make_msg(msg))
+        self.stream.flush()
+
     def emit(self, record: logging.LogRecord):
+        if getattr(record, 'progress', False):
+            self.emit_progress(record)
+            return
+        self.progress_len = 0
+
         same_line = record.levelno % 5
         prefix = ' ' if same_line else '\n'
         if record.msg:
@@ -104,8 +122,8 @@ def parse_input() -> Iterator[tuple[str, dict]]:
 
     if batchmode:
         report.info(tp_text.batch)
-        for p in Path(cli_config.scan_dir).glob('*.torrent'):
-            yield p.name, {'dtor_path': p, 'scanned': True}
+        for p, meta in parse_dtors(Path(cli_config.scan_dir).glob('*.torrent')):
+            yield p.name, {'dtor_path': p, 'scanned': True, 'dtor_meta': meta}
 
 
 def get_jobs() -> Iterator[Job]:
@@ -125,10 +143,14 @@ def main():
         'data_dir': Path(cli_config.data_dir),
         'deep_search': cli_config.deep_search,
         'deep_search_level': cli_config.deep_search_level,
+        'content_search': cli_config.content_search,
         'dtor_save_dir': Path(tsd) if (tsd := cli_config.torrent_save_dir) else None,
         'save_dtors': bool(cli_config.torrent_save_dir),
         'del_dtors': cli_config.del_dtors,
         'file_check': cli_config.file_check,
+        'piece_check': cli_config.piece_check,
+        'piece_sample': cli_config.piece_check_sample,
+        'spare_page_cache': cli_config.spare_page_cache,
         'rel_descr_templ': cli_config.rel_descr,
         'rel_descr_own_templ': cli_config.rel_descr_own_uploads,
         'add_src_descr': cli_config.add_src_descr,
@@ -136,6 +158,8 @@ def main():
         'img_rehost': cli_config.img_rehost,
         'whitelist': cli_config.whitelist,
         'post_compare': cli_config.post_upload_checks,
+        'job_timeout': cli_config.job_timeout,
+        'info_cache_ttl': cli_config.info_cache_ttl,
     }
     if cli_config.img_rehost:
         IH.set_attrs(cli_config.image_hosts)
@@ -146,6 +170,9 @@ def main():
     for job in get_jobs():
         try:
             transplanter.do_your_job(job)
+        except JobTimeout as e:
+            report.error(str(e))
+            continue
         except Exception:
             report.exception('')
             continue